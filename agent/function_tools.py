@@ -649,8 +649,8 @@ def get_soap_route_recommendation(start_station_name: str, end_station_name: str
     """
     logger.info(f"--- [工具(官方路線)] 查詢: {start_station_name} -> {end_station_name} ---")
     try:
-        # 注意：這裡我們調用 routing_manager 的新方法，而不是直接調用 soap service
-        recommendation = routing_manager.get_route_recommendation_soap(start_station_name, end_station_name)
+        # 注意：這裡我們調用 routing_manager 的方法，而不是直接調用 soap service；站名 -> SID 由 StationManager 查表完成
+        recommendation = routing_manager.find_path_with_soap(start_station_name, end_station_name)
         return json.dumps(recommendation, ensure_ascii=False)
     except (StationNotFoundError, RouteNotFoundError) as e:
         logger.warning(f"--- [工具(官方路線)] 查詢時發生錯誤: {e} ---")
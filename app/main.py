@@ -3,13 +3,22 @@ from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any
+from contextlib import asynccontextmanager
 
 from agent.agent import agent_executor
+from services import service_registry
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 應用程式關閉時停止背景線程，並釋放 SOAP 連線池與執行緒池
+    service_registry.shutdown()
 
 app = FastAPI(
     title="MetroPet AI Agent",
     description="An AI agent for Taipei Metro.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 templates = Jinja2Templates(directory="templates")
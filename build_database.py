@@ -6,7 +6,8 @@ import re
 import time
 import config
 from services.tdx_service import tdx_api
-from services.metro_soap_service import MetroSoapService
+from services.metro_soap_service import get_metro_soap_api
+from utils.transfer_stations import save_transfer_stations
 
 # 為了避免循環依賴和簡化，我們在這裡重新定義一個與 StationManager 內部邏輯相同的 normalize_name 函數。
 def normalize_name(name: str) -> str:
@@ -24,15 +25,9 @@ def build_station_database():
     """
     print("\n--- [1/5] 正在建立「站點資料庫」... ---")
     
-    # 初始化服務
-    metro_soap_service = MetroSoapService(
-        username=config.METRO_API_USERNAME,
-        password=config.METRO_API_PASSWORD
-    )
-    
     # 優先使用 SOAP API
     print("--- 正在嘗試從台北捷運官方 SOAP API 獲取站點資料... ---")
-    all_stations_data = metro_soap_service.get_station_list_soap()
+    all_stations_data = get_metro_soap_api().get_station_list_soap()
     source = "SOAP"
 
     # 如果 SOAP 失敗，則回退到 TDX API
@@ -88,6 +83,10 @@ def build_station_database():
     with open(config.STATION_DATA_PATH, 'w', encoding='utf-8') as f:
         json.dump(station_map_list, f, ensure_ascii=False, indent=2)
     print(f"--- ✅ 站點資料庫建立成功 (來源: {source})，共 {len(station_map_list)} 個站名。 ---")
+
+    # 轉乘站集合只依賴站點資料，在此一併預先算好並序列化，訓練與預測端不必再解析整份 JSON
+    transfer_stations = save_transfer_stations(station_map_list)
+    print(f"--- ✅ 轉乘站集合已儲存至 {config.TRANSFER_STATIONS_PATH}，共 {len(transfer_stations)} 個車站 ID。 ---")
     time.sleep(1)
 
 def build_fare_database():
@@ -18,6 +18,12 @@ EXIT_DATA_PATH = os.path.join(DATA_DIR, 'mrt_station_exits.json')
 FACILITIES_DATA_PATH = os.path.join(DATA_DIR, 'mrt_station_facilities.json')
 LINE_DATA_PATH = os.path.join(DATA_DIR, 'mrt_lines_info.json') # 新增：路線資料路徑
 FIRST_LAST_TIMETABLE_DATA_PATH = os.path.join(DATA_DIR, '02靜態時刻表與首末班車資料_13首末班車時刻表資料_FirstLastTimetable_2層(11208修正不含環狀線)北市平台版.csv') 
+TRANSFER_STATIONS_PATH = os.path.join(DATA_DIR, 'transfer_stations.pkl') # 轉乘站 ID 集合 (由 build_database.py 產生)
+STATIONS_SID_MAP_PATH = os.path.join(DATA_DIR, 'mrt_station_id_to_sid.json') # 車站 ID -> 北捷 SOAP SID
+# TDX 等外部 API 回應的磁碟快取目錄
+API_CACHE_DIR = os.path.join(DATA_DIR, 'cache', 'tdx')
+# 北捷 SOAP API 近乎靜態端點 (車站列表等) 的磁碟快取目錄
+SOAP_CACHE_DIR = os.path.join(DATA_DIR, 'cache', 'metro_soap')
 # 【新】讀取北捷 API 帳密 (如果未來需要，目前未使用)
 METRO_API_USERNAME = os.getenv("METRO_API_USERNAME")
 METRO_API_PASSWORD = os.getenv("METRO_API_PASSWORD")
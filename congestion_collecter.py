@@ -1,11 +1,14 @@
 # data_collector.py
 
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
 import logging
 from datetime import datetime
 # 假設您的 service 檔案位於 services/metro_soap_service.py
-from services.metro_soap_service import metro_soap_api
+from services.metro_soap_service import get_metro_soap_api, close_metro_soap_api
 import time
 
 # --- (日誌設定與路徑定義，這部分維持原樣即可) ---
@@ -16,8 +19,15 @@ logger = logging.getLogger(__name__)
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(PROJECT_ROOT, 'data')
 
-HIGH_CAPACITY_CONGESTION_FILE = os.path.join(DATA_DIR, 'high_capacity_congestion.csv')
-WENHU_CONGESTION_FILE = os.path.join(DATA_DIR, 'wenhu_congestion.csv')
+# 歷史資料以 Parquet 分區目錄儲存：<目錄>/date=YYYY-MM-DD/part-<時間>.parquet，跨日後前幾天的分區合併為 part-compacted.parquet
+HIGH_CAPACITY_CONGESTION_FILE = os.path.join(DATA_DIR, 'high_capacity_congestion')
+WENHU_CONGESTION_FILE = os.path.join(DATA_DIR, 'wenhu_congestion')
+
+# 舊版以單一 CSV 儲存的歷史資料，啟動時會一次性轉入 Parquet 分區目錄
+LEGACY_CSV_FILES = {
+    HIGH_CAPACITY_CONGESTION_FILE: os.path.join(DATA_DIR, 'high_capacity_congestion.csv'),
+    WENHU_CONGESTION_FILE: os.path.join(DATA_DIR, 'wenhu_congestion.csv')
+}
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
@@ -34,124 +44,264 @@ FINAL_COLUMNS = [
     'car6_congestion'
 ]
 
-# --- (load_data 和 save_data 函數維持原樣，它們的設計是正確的) ---
-def load_data(file_path: str) -> pd.DataFrame:
-    if os.path.exists(file_path):
+CAR_COLUMNS = [col for col in FINAL_COLUMNS if col.endswith('_congestion')]
+
+# 去重鍵：以 (timestamp, station_id, line_direction_cid) 判斷是否為同一筆記錄
+DEDUP_KEY_COLUMNS = ['timestamp', 'station_id', 'line_direction_cid']
+
+def conform_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """確保欄位符合 FINAL_COLUMNS；欄位已完全一致時直接返回，省去一次 reindex 複製。"""
+    if list(df.columns) == FINAL_COLUMNS:
+        return df
+    return df.reindex(columns=FINAL_COLUMNS, fill_value=0)
+
+def to_storage_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    將資料轉為緊湊的儲存型別 (int8 / int16 / datetime64[s] / category)，
+    並丟棄 timestamp 或 station_id 無法解析的髒資料。
+    """
+    df = conform_columns(df)
+    typed = pd.DataFrame({
+        'timestamp': pd.to_datetime(df['timestamp'], errors='coerce'),
+        'station_id': df['station_id'],
+        'line_direction_cid': pd.to_numeric(df['line_direction_cid'], errors='coerce').fillna(0).astype('int16')
+    })
+    for col in CAR_COLUMNS:
+        typed[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('int8')
+    # ignore_index=True 直接產生 RangeIndex，不需再另外 reset_index
+    typed = typed.dropna(subset=['timestamp', 'station_id'], ignore_index=True)
+    typed['timestamp'] = typed['timestamp'].astype('datetime64[s]')
+    typed['station_id'] = typed['station_id'].astype(str).astype('category')
+    return typed
+
+def load_data(dataset_dir: str) -> pd.DataFrame:
+    if os.path.isdir(dataset_dir) and os.listdir(dataset_dir):
         try:
-            df = pd.read_csv(file_path)
-            return df.reindex(columns=FINAL_COLUMNS, fill_value=0)
-        except pd.errors.EmptyDataError:
-            logger.warning(f"⚠️ CSV 檔案 '{file_path}' 為空，將建立新的 DataFrame。")
-            return pd.DataFrame(columns=FINAL_COLUMNS)
+            df = pd.read_parquet(dataset_dir, engine='pyarrow', columns=FINAL_COLUMNS)
+            return conform_columns(df)
         except Exception as e:
-            logger.error(f"❌ 載入檔案 '{file_path}' 時發生錯誤: {e}", exc_info=True)
+            logger.error(f"❌ 載入資料集 '{dataset_dir}' 時發生錯誤: {e}", exc_info=True)
             return pd.DataFrame(columns=FINAL_COLUMNS)
-    logger.info(f"📁 檔案 '{file_path}' 不存在，將建立新的 DataFrame。")
+    logger.info(f"📁 資料集 '{dataset_dir}' 不存在，將建立新的 DataFrame。")
     return pd.DataFrame(columns=FINAL_COLUMNS)
 
-def save_data(df: pd.DataFrame, file_path: str):
-    # 【關鍵點2】儲存前，強制 DataFrame 符合 FINAL_COLUMNS 的結構
-    df_to_save = df.reindex(columns=FINAL_COLUMNS, fill_value=0)
-    df_to_save.to_csv(file_path, index=False, mode='w', header=True)
-    logger.info(f"📊 已將 {len(df_to_save)} 筆資料儲存到 {file_path}")
-
-# --- (process_* 函數維持原樣，它們的設計是正確的) ---
+def save_data(df: pd.DataFrame, dataset_dir: str):
+    """
+    【關鍵點2】依日期將資料寫成獨立的小 Parquet 檔，每輪只新增檔案而不重寫歷史資料。
+    傳入的 DataFrame 應已經過 to_storage_dtypes 轉換。
+    """
+    df_to_save = conform_columns(df)
+    batch_id = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    # 整批只轉換一次為 Arrow Table，各日期分區直接以列索引切片寫出，不必每組再經 pandas 轉換
+    table = pa.Table.from_pandas(df_to_save, preserve_index=False)
+    dates = df_to_save['timestamp'].dt.strftime('%Y-%m-%d').to_numpy()
+    for date in np.unique(dates):
+        partition_dir = os.path.join(dataset_dir, f'date={date}')
+        os.makedirs(partition_dir, exist_ok=True)
+        part = table.take(np.flatnonzero(dates == date))
+        # 先寫入以 '.' 開頭的暫存檔 (讀取資料集時會被略過)，完成後再原子性改名，中途中斷不會留下截斷的檔案
+        tmp_path = os.path.join(partition_dir, f'.part-{batch_id}.tmp')
+        pq.write_table(part, tmp_path, compression='zstd')
+        os.replace(tmp_path, os.path.join(partition_dir, f'part-{batch_id}.parquet'))
+    logger.info(f"📊 已將 {len(df_to_save)} 筆資料儲存到 {dataset_dir}")
 
-def process_high_capacity_data(raw_data: list[dict]) -> pd.DataFrame:
-    processed_records = []
-    for item in raw_data:
+def compact_partitions(dataset_dir: str, before_date: str) -> int:
+    """
+    將 before_date (YYYY-MM-DD) 之前、含多個小檔的日期分區合併為單一 Parquet 檔，
+    避免每 5 分鐘一個檔案讓讀取整個資料集的成本無限成長。
+    先寫出合併檔再刪除舊檔：中途失敗最多留下重複資料，不會遺失資料。
+    :return: 合併的分區數。
+    """
+    if not os.path.isdir(dataset_dir):
+        return 0
+    compacted = 0
+    for name in sorted(os.listdir(dataset_dir)):
+        if not name.startswith('date=') or name[len('date='):] >= before_date:
+            continue
+        partition_dir = os.path.join(dataset_dir, name)
+        parts = [f for f in os.listdir(partition_dir) if f.endswith('.parquet')]
+        if len(parts) <= 1:
+            continue
         try:
-            # 【關鍵點3】從複雜的 API 回應中，只挑選我們需要的欄位，並對應到標準名稱
-            record = {
-                'timestamp': item.get('utime', ''),
-                'station_id': item.get('StationID', ''),
-                'line_direction_cid': int(item.get('CID', '0')) if str(item.get('CID', '0')).isdigit() else 0,
-                'car1_congestion': item.get('Cart1L', '0'),
-                'car2_congestion': item.get('Cart2L', '0'),
-                'car3_congestion': item.get('Cart3L', '0'),
-                'car4_congestion': item.get('Cart4L', '0'),
-                'car5_congestion': item.get('Cart5L', '0'),
-                'car6_congestion': item.get('Cart6L', '0')
-            }
-            if not all([record['timestamp'], record['station_id']]):
-                logger.warning(f"高運量線記錄缺少必要欄位 (timestamp/station_id)，跳過: {item}")
-                continue
-            processed_records.append(record)
+            df = pd.concat([pd.read_parquet(os.path.join(partition_dir, f), engine='pyarrow') for f in parts], ignore_index=True)
+            df = to_storage_dtypes(df).drop_duplicates(subset=DEDUP_KEY_COLUMNS, keep='last', ignore_index=True)
+            # 以 '.' 開頭的暫存檔會被 pyarrow 讀取資料集時略過
+            tmp_path = os.path.join(partition_dir, '.compacting.tmp')
+            final_name = 'part-compacted.parquet'
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression='zstd')
+            os.replace(tmp_path, os.path.join(partition_dir, final_name))
+            for f in parts:
+                if f != final_name:
+                    os.remove(os.path.join(partition_dir, f))
+            compacted += 1
+            logger.info(f"🗜️ 已將 {partition_dir} 的 {len(parts)} 個檔案合併為一個 ({len(df)} 筆)。")
         except Exception as e:
-            logger.error(f"❌ 處理高運量線單筆資料時發生錯誤: {item} - {e}", exc_info=True)
-            continue
-    df = pd.DataFrame(processed_records)
+            logger.error(f"❌ 合併分區 '{partition_dir}' 時發生錯誤: {e}", exc_info=True)
+    return compacted
+
+def migrate_legacy_csv(dataset_dir: str):
+    """若 Parquet 資料集尚未建立而舊版 CSV 存在，將 CSV 歷史資料一次性轉入資料集。"""
+    csv_path = LEGACY_CSV_FILES.get(dataset_dir)
+    if os.path.isdir(dataset_dir) or not csv_path or not os.path.exists(csv_path):
+        return
+    try:
+        legacy_df = pd.read_csv(csv_path)
+    except pd.errors.EmptyDataError:
+        logger.warning(f"⚠️ CSV 檔案 '{csv_path}' 為空，略過轉檔。")
+        return
+    legacy_df = to_storage_dtypes(legacy_df).drop_duplicates(subset=DEDUP_KEY_COLUMNS, keep='last', ignore_index=True)
+    save_data(legacy_df, dataset_dir)
+    logger.info(f"🔁 已將舊版 CSV '{csv_path}' 轉存為 Parquet 資料集 '{dataset_dir}'。")
+
+def _build_keys(df: pd.DataFrame) -> np.ndarray:
+    """
+    將 (timestamp, station_id, line_direction_cid) 向量化雜湊成一個 uint64 鍵。
+    pandas 的物件雜湊使用固定金鑰，跨批次、跨重啟皆穩定，可直接存入 seen 集合比對。
+    """
+    keys = pd.DataFrame({
+        # 統一換算為秒，避免 datetime64[s] / [ns] 單位不同造成同一時間雜湊不一致
+        'timestamp': pd.to_datetime(df['timestamp'], errors='coerce').astype('datetime64[s]').astype('int64'),
+        'station_id': df['station_id'].astype(str),
+        'line_direction_cid': pd.to_numeric(df['line_direction_cid'], errors='coerce').fillna(0).astype('int64')
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+# --- process_* 函數：以 pandas 向量化方式完成欄位對應與清理 ---
+
+# 【關鍵點3】API 原始欄位 -> 標準欄位名稱的對應表
+HIGH_CAPACITY_COLUMN_MAP = {
+    'utime': 'timestamp',
+    'StationID': 'station_id',
+    'CID': 'line_direction_cid',
+    'Cart1L': 'car1_congestion',
+    'Cart2L': 'car2_congestion',
+    'Cart3L': 'car3_congestion',
+    'Cart4L': 'car4_congestion',
+    'Cart5L': 'car5_congestion',
+    'Cart6L': 'car6_congestion'
+}
+
+# 【關鍵點4】文湖線只有 4 節車廂，car5/car6 由 reindex 補 0
+WENHU_COLUMN_MAP = {
+    'UpdateTime': 'timestamp',
+    'StationID': 'station_id',
+    'CID': 'line_direction_cid',
+    'Car1': 'car1_congestion',
+    'Car2': 'car2_congestion',
+    'Car3': 'car3_congestion',
+    'Car4': 'car4_congestion'
+}
+
+def _process_raw_data(raw_data: list[dict], column_map: dict, line_label: str) -> pd.DataFrame:
+    """
+    將 API 原始資料一次性建成 DataFrame，並以向量化操作完成欄位改名、CID 解析與缺漏過濾。
+    """
+    # 建構時直接以 columns 指定只取需要的原始欄位 (缺漏者為 NaN)，省去建完再 reindex 的複製
+    df = pd.DataFrame(raw_data, columns=list(column_map)).rename(columns=column_map)
+
+    # CID 僅在整串皆為數字時轉為整數，其餘 (如 "1/2"、空值) 一律視為 0，與模型訓練使用的類別一致
+    cid = df['line_direction_cid'].astype(str)
+    df['line_direction_cid'] = pd.to_numeric(cid.where(cid.str.isdigit(), '0'), errors='coerce').fillna(0).astype(int)
+
+    # 缺少 timestamp / station_id 的記錄無法使用，直接丟棄
+    required = ['timestamp', 'station_id']
+    df[required] = df[required].replace('', pd.NA)
+    before = len(df)
+    df = df.dropna(subset=required, ignore_index=True)
+    if len(df) < before:
+        logger.warning(f"{line_label}有 {before - len(df)} 筆記錄缺少必要欄位 (timestamp/station_id)，已跳過。")
+
+    car_columns = [col for col in df.columns if col.endswith('_congestion')]
+    df[car_columns] = df[car_columns].fillna('0')
+
     # 再次確保欄位結構正確
-    df = df.reindex(columns=FINAL_COLUMNS, fill_value=0)
-    return df
+    return conform_columns(df)
+
+def process_high_capacity_data(raw_data: list[dict]) -> pd.DataFrame:
+    return _process_raw_data(raw_data, HIGH_CAPACITY_COLUMN_MAP, "高運量線")
 
 def process_wenhu_data(raw_data: list[dict]) -> pd.DataFrame:
-    processed_records = []
-    for item in raw_data:
-        try:
-            # 【關鍵點4】同樣地，處理文湖線資料，並手動補上不存在的車廂
-            record = {
-                'timestamp': item.get('UpdateTime', ''),
-                'station_id': item.get('StationID', ''),
-                'line_direction_cid': int(item.get('CID', '0')) if str(item.get('CID', '0')).isdigit() else 0,
-                'car1_congestion': item.get('Car1', '0'),
-                'car2_congestion': item.get('Car2', '0'),
-                'car3_congestion': item.get('Car3', '0'),
-                'car4_congestion': item.get('Car4', '0'),
-                'car5_congestion': '0', # 文湖線固定為0
-                'car6_congestion': '0'  # 文湖線固定為0
-            }
-            if not all([record['timestamp'], record['station_id']]):
-                logger.warning(f"文湖線記錄缺少必要欄位 (timestamp/station_id)，跳過: {item}")
+    return _process_raw_data(raw_data, WENHU_COLUMN_MAP, "文湖線")
+
+# --- 主邏輯：CongestionCollector 在記憶體中保存各資料集的去重鍵，跨輪次重複使用 ---
+class CongestionCollector:
+    """
+    定期收集高運量線與文湖線的車廂擁擠度資料。
+    歷史資料只在初始化時載入一次以建立去重鍵，之後每輪只處理新取得的批次。
+    """
+    def __init__(self, soap_api=None):
+        self.soap_api = soap_api or get_metro_soap_api()
+        # (顯示名稱, 取得原始資料的方法, 處理函數, 資料集路徑)
+        self.lines = [
+            ("高運量線", self.soap_api.get_high_capacity_car_weight_info, process_high_capacity_data, HIGH_CAPACITY_CONGESTION_FILE),
+            ("文湖線", self.soap_api.get_wenhu_car_weight_info, process_wenhu_data, WENHU_CONGESTION_FILE)
+        ]
+        self.seen_keys: dict[str, set[int]] = {}
+        # 記錄最近一次合併分區時的日期，跨日後合併前幾天的小檔
+        self.compacted_before = datetime.now().strftime('%Y-%m-%d')
+        for _, _, _, dataset_dir in self.lines:
+            migrate_legacy_csv(dataset_dir)
+            compact_partitions(dataset_dir, self.compacted_before)
+            existing_df = load_data(dataset_dir)
+            self.seen_keys[dataset_dir] = set(_build_keys(existing_df).tolist())
+            logger.info(f"🔑 已從 {dataset_dir} 載入 {len(self.seen_keys[dataset_dir])} 筆既有資料的去重鍵。")
+
+    def append_new_records(self, processed_df: pd.DataFrame, dataset_dir: str) -> int:
+        """
+        只將尚未寫入過的記錄寫入資料集，避免每輪都重讀、合併並重寫整個歷史資料。
+        :return: 實際新增的筆數。
+        """
+        seen = self.seen_keys[dataset_dir]
+        batch = to_storage_dtypes(processed_df)
+        keys = _build_keys(batch)
+        # 批次內以雜湊鍵去重 (保留最後一筆)，再排除已寫入過的鍵
+        keep = ~pd.Series(keys).duplicated(keep='last').to_numpy()
+        batch, keys = batch[keep], keys[keep]
+        mask = np.fromiter((key not in seen for key in keys.tolist()), dtype=bool, count=len(keys))
+        new_df = batch[mask]
+        if new_df.empty:
+            return 0
+
+        save_data(new_df, dataset_dir)
+        seen.update(keys[mask].tolist())
+        return len(new_df)
+
+    def run_once(self):
+        logger.info("--- [Collector] 開始新一輪資料收集 ---")
+        # 兩條路線的 API 互不相依，並行取得後再依序處理與寫入
+        raw_batches = self.soap_api.fetch_many({label: fetch for label, fetch, _, _ in self.lines})
+        for label, _, process, dataset_dir in self.lines:
+            logger.info(f"--- 處理{label}資料 ---")
+            raw_data = raw_batches[label]
+            if not raw_data:
+                logger.error(f"    -> ❌ 從 API 獲取{label}原始資料失敗。")
                 continue
-            processed_records.append(record)
-        except Exception as e:
-            logger.error(f"❌ 處理文湖線單筆資料時發生錯誤: {item} - {e}", exc_info=True)
-            continue
-    df = pd.DataFrame(processed_records)
-    df = df.reindex(columns=FINAL_COLUMNS, fill_value=0)
-    return df
-
-# --- (主邏輯 collect_and_save_congestion_data 維持原樣) ---
-def collect_and_save_congestion_data():
-    logger.info("--- [Collector] 開始新一輪資料收集 ---")
-    
-    # 高運量線
-    logger.info("--- 嘗試獲取高運量線資料 ---")
-    high_capacity_raw_data = metro_soap_api.get_high_capacity_car_weight_info()
-    if high_capacity_raw_data:
-        processed_df = process_high_capacity_data(high_capacity_raw_data)
-        existing_df = load_data(HIGH_CAPACITY_CONGESTION_FILE)
-        combined_df = pd.concat([existing_df, processed_df]).drop_duplicates(subset=['timestamp', 'station_id', 'line_direction_cid'], keep='last').reset_index(drop=True)
-        save_data(combined_df, HIGH_CAPACITY_CONGESTION_FILE)
-        logger.info(f"    -> ✅ 高運量線處理完畢。新獲取 {len(processed_df)} 筆，目前總共 {len(combined_df)} 筆。")
-    else:
-        logger.error("    -> ❌ 從 API 獲取高運量線原始資料失敗。")
-
-    # 文湖線
-    logger.info("--- 嘗試獲取文湖線資料 ---")
-    wenhu_raw_data = metro_soap_api.get_wenhu_car_weight_info()
-    if wenhu_raw_data:
-        processed_df = process_wenhu_data(wenhu_raw_data)
-        existing_df = load_data(WENHU_CONGESTION_FILE)
-        combined_df = pd.concat([existing_df, processed_df]).drop_duplicates(subset=['timestamp', 'station_id', 'line_direction_cid'], keep='last').reset_index(drop=True)
-        save_data(combined_df, WENHU_CONGESTION_FILE)
-        logger.info(f"    -> ✅ 文湖線處理完畢。新獲取 {len(processed_df)} 筆，目前總共 {len(combined_df)} 筆。")
-    else:
-        logger.error("    -> ❌ 從 API 獲取文湖線原始資料失敗。")
-
-    logger.info("--- [Collector] 資料收集完成，等待 5 分鐘後下一次更新... ---")
+            processed_df = process(raw_data)
+            added = self.append_new_records(processed_df, dataset_dir)
+            logger.info(f"    -> ✅ {label}處理完畢。新獲取 {len(processed_df)} 筆，新增 {added} 筆，目前總共 {len(self.seen_keys[dataset_dir])} 筆。")
+
+        today = datetime.now().strftime('%Y-%m-%d')
+        if today != self.compacted_before:
+            for _, _, _, dataset_dir in self.lines:
+                compact_partitions(dataset_dir, today)
+            self.compacted_before = today
+        logger.info("--- [Collector] 資料收集完成，等待 5 分鐘後下一次更新... ---")
 
 
 if __name__ == "__main__":
-    while True:
-        try:
-            collect_and_save_congestion_data()
-            time.sleep(5 * 60) # 等待 5 分鐘
-        except KeyboardInterrupt:
-            logger.info("--- [Collector] 收到手動中斷指令，程式正在關閉... ---")
-            break
-        except Exception as e:
-            logger.critical(f"--- ❌ Collector 主迴圈發生嚴重錯誤: {e} ---", exc_info=True)
-            logger.info("--- [Collector] 將在 5 分鐘後重試... ---\n")
-            time.sleep(300)
\ No newline at end of file
+    collector = CongestionCollector()
+    try:
+        while True:
+            try:
+                collector.run_once()
+                time.sleep(5 * 60) # 等待 5 分鐘
+            except KeyboardInterrupt:
+                logger.info("--- [Collector] 收到手動中斷指令，程式正在關閉... ---")
+                break
+            except Exception as e:
+                logger.critical(f"--- ❌ Collector 主迴圈發生嚴重錯誤: {e} ---", exc_info=True)
+                logger.info("--- [Collector] 將在 5 分鐘後重試... ---\n")
+                time.sleep(300)
+    finally:
+        # 釋放 SOAP 連線池與並行呼叫用的執行緒池
+        close_metro_soap_api()
@@ -2,17 +2,19 @@
 
 import pandas as pd
 import xgboost as xgb
-from sklearn.model_selection import train_test_split, GridSearchCV, TimeSeriesSplit
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report, roc_auc_score
-from imblearn.over_sampling import SMOTE
 import numpy as np
 import joblib
+from joblib import Parallel, delayed
 import os
 import logging
-from typing import Tuple, List
+from typing import Tuple, List, Dict
 import json
 import glob
+import hashlib
+import itertools
+import warnings
 
 # --- 配置日誌 ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -27,7 +29,45 @@ import sys
 if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
-def preprocess_for_training(filepath: str, line_type: str) -> Tuple[pd.DataFrame, List[str], OneHotEncoder, StandardScaler]:
+from utils.transfer_stations import load_transfer_stations
+
+# --- 預處理結果快取 ---
+# 特徵工程邏輯或輸出欄位變動時務必調整版本號，舊快取即自動失效
+FEATURE_VERSION = 'v6'
+CACHE_DIR = os.path.join(MODEL_DIR, 'cache')
+
+def _source_fingerprint(filepath: str) -> str:
+    """
+    以最後修改時間與總大小描述資料來源；Parquet 分區目錄取其中所有檔案的最大修改時間、總大小與檔案數。
+    只比對 mtime 可能漏掉同一秒內的改寫，加入大小可降低誤命中的機率。
+    """
+    if not os.path.isdir(filepath):
+        return f"{os.path.getmtime(filepath)}_{os.path.getsize(filepath)}"
+    stats = [os.stat(os.path.join(root, name)) for root, _, files in os.walk(filepath) for name in files]
+    latest = max((st.st_mtime for st in stats), default=os.path.getmtime(filepath))
+    return f"{latest}_{sum(st.st_size for st in stats)}_{len(stats)}"
+
+def _cache_path(filepath: str, line_type: str) -> str:
+    digest = hashlib.blake2b(f"{_source_fingerprint(filepath)}_{line_type}_{FEATURE_VERSION}".encode(), digest_size=8).hexdigest()
+    key = f"{line_type}_{digest}"
+    return os.path.join(CACHE_DIR, f"{key}.parquet")
+
+# --- 運算裝置偵測 ---
+def _detect_device() -> str:
+    """偵測 XGBoost 是否能使用 CUDA GPU；編譯版本不支援或沒有可用的 GPU 時退回 CPU。"""
+    if not xgb.build_info().get('USE_CUDA'):
+        return 'cpu'
+    try:
+        probe = xgb.DMatrix(np.zeros((2, 1), dtype=np.float32), label=np.array([0, 1], dtype=np.float32))
+        # 找不到 GPU 時 XGBoost 只會警告並自動改用 CPU，因此以訓練後的實際設定為準
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            booster = xgb.train({'tree_method': 'hist', 'device': 'cuda'}, probe, num_boost_round=1)
+        return json.loads(booster.save_config())['learner']['generic_param'].get('device', 'cpu')
+    except xgb.core.XGBoostError:
+        return 'cpu'
+
+def preprocess_for_training(filepath: str, line_type: str) -> Tuple[pd.DataFrame, List[str], Dict[str, pd.Index]]:
     """
     【✨核心特徵工程升級 2.0✨】
     從原始 CSV 讀取資料，創建更豐富的時間與空間特徵，並為分類任務做準備。
@@ -35,82 +75,138 @@ def preprocess_for_training(filepath: str, line_type: str) -> Tuple[pd.DataFrame
     logger.info(f"--- 開始預處理 {line_type} 資料從 {filepath} ---")
     if not os.path.exists(filepath):
         raise FileNotFoundError(f"資料檔案不存在: {filepath}。請先執行 data_collector.py。")
-    
-    df = pd.read_csv(filepath)
-    if df.empty:
-        raise ValueError(f"{filepath} 為空，無法進行訓練。")
 
-    # 1. 資料格式轉換 (Wide to Long) - 維持不變
+    # 來源資料未變動時直接沿用上次的預處理結果
+    cache_path = _cache_path(filepath, line_type)
+    if os.path.exists(cache_path):
+        final_df = pd.read_parquet(cache_path, engine='pyarrow')
+        feature_columns = [col for col in final_df.columns if col != 'congestion']
+        categories = {col: final_df[col].cat.categories for col in final_df.select_dtypes('category').columns}
+        logger.info(f"--- ✅ 命中預處理快取 {os.path.basename(cache_path)}，共 {len(final_df)} 筆訓練樣本。")
+        return final_df, feature_columns, categories
+    
     num_cars = 4 if line_type == 'wenhu' else 6
     value_vars = [f'car{i}_congestion' for i in range(1, num_cars + 1)]
     id_vars = ['timestamp', 'station_id', 'line_direction_cid']
-    
-    df_melted = df.melt(id_vars=id_vars, value_vars=value_vars, var_name='car_position', value_name='congestion')
-    df_melted['car_number'] = df_melted['car_position'].str.extract(r'(\d+)').astype(int)
+
+    # 收集器以 Parquet 分區目錄儲存歷史資料；舊版單一 CSV 檔仍可直接讀取
+    # 兩種來源都只讀取需要的欄位；CSV 的 schema 已知，直接指定型別以省去逐欄推斷
+    if os.path.isdir(filepath):
+        df = pd.read_parquet(filepath, engine='pyarrow', columns=id_vars + value_vars)
+    else:
+        df = pd.read_csv(
+            filepath,
+            usecols=id_vars + value_vars,
+            # 舊版 CSV 中混有欄位錯位的髒資料，方向欄位保留為字串、車廂欄位用 float32 容納缺值，交由後續清理
+            dtype={'station_id': 'category', 'line_direction_cid': 'string', **{col: 'float32' for col in value_vars}},
+            parse_dates=['timestamp'],
+            engine='pyarrow',
+        )
+    if df.empty:
+        raise ValueError(f"{filepath} 為空，無法進行訓練。")
+
+    # 1. 資料格式轉換 (Wide to Long)
+    # 車廂編號由欄位位置即可得知，直接以 np.repeat / np.tile 一次建出長表，不需 melt 與正則擷取
+    # 轉乘站旗標只與車站有關，在寬表 (每筆觀測一列) 上判斷後再隨 id 欄位一起展開，比在長表上判斷少 num_cars 倍的比對
+    # 轉乘站集合由 build_database.py 預先序列化，每次訓練只在此載入一次
+    is_transfer_station = df['station_id'].isin(load_transfer_stations()).to_numpy(dtype=np.int8)
+    df_melted = pd.DataFrame({
+        **{col: np.repeat(df[col].to_numpy(), num_cars) for col in id_vars},
+        'is_transfer_station': np.repeat(is_transfer_station, num_cars),
+        'car_number': np.tile(np.arange(1, num_cars + 1), len(df)),
+        'congestion': df[value_vars].to_numpy().reshape(-1)
+    })
     
     # 清理目標變數：確保擁擠度是 1, 2, 3, 4 其中之一
     df_melted['congestion'] = pd.to_numeric(df_melted['congestion'], errors='coerce')
     df_melted.dropna(subset=['congestion'], inplace=True)
-    df_melted = df_melted[df_melted['congestion'].isin([1, 2, 3, 4])].astype({'congestion': int})
+    df_melted = df_melted[df_melted['congestion'].isin([1, 2, 3, 4])].astype({'congestion': 'int8'})
 
     # --- 【 ✨ 特徵工程 2.0 - 導入專家知識 ✨ 】 ---
     logger.info("      -> 正在創建 2.0 版特徵...")
-    df_melted['timestamp'] = pd.to_datetime(df_melted['timestamp'])
+    # 讀取時已解析為 datetime，此處只剔除原先由整表 fillna(0) 掩蓋的無效時間戳
+    df_melted = df_melted.dropna(subset=['timestamp'])
     
     # (A) 更豐富的時間特徵
-    df_melted['hour'] = df_melted['timestamp'].dt.hour
+    # 時間戳只讀取一次：轉為自 epoch 起的整數秒，以整數運算一次推出所有欄位，取代多次 .dt 存取
+    seconds = df_melted['timestamp'].to_numpy(dtype='datetime64[s]').view('i8')
+    hour = ((seconds // 3600) % 24).astype(np.int8)
+    df_melted['hour'] = hour
     # 【新增】更細粒度的時間特徵
-    df_melted['minute'] = df_melted['timestamp'].dt.minute
-    df_melted['day_of_week'] = df_melted['timestamp'].dt.dayofweek
-    df_melted['is_weekend'] = (df_melted['day_of_week'] >= 5).astype(int)
-    df_melted['is_peak_hour'] = df_melted['hour'].isin([7, 8, 17, 18, 19]).astype(int)
+    df_melted['minute'] = ((seconds // 60) % 60).astype(np.int8)
+    # 1970-01-01 為星期四 (dayofweek=3)
+    day_of_week = ((seconds // 86400 + 3) % 7).astype(np.int8)
+    df_melted['day_of_week'] = day_of_week
+    df_melted['is_weekend'] = (day_of_week >= 5).astype(np.int8)
+    df_melted['is_peak_hour'] = np.isin(hour, np.array([7, 8, 17, 18, 19], dtype=np.int8)).astype(np.int8)
 
-    # (B) 結合捷運路網的空間特徵 (Domain Knowledge)
-    with open(os.path.join(DATA_DIR, 'mrt_station_info.json'), 'r', encoding='utf-8') as f:
-        station_info = json.load(f)
-    
-    transfer_stations = {sid for info in station_info.values() if isinstance(info, dict) for sid in info.get('station_ids', []) if info.get('is_transfer')}
-    df_melted['is_transfer_station'] = df_melted['station_id'].isin(transfer_stations).astype(int)
+    # (B) 結合捷運路網的空間特徵 (Domain Knowledge)：is_transfer_station 已於寬表轉長表時一併產生
     
     # (C) 滯後特徵 (維持不變，但未來可強化)
     df_melted = df_melted.sort_values(by=['station_id', 'line_direction_cid', 'car_number', 'timestamp'])
-    df_melted['lag_5min_congestion'] = df_melted.groupby(['station_id', 'line_direction_cid', 'car_number'])['congestion'].shift(1)
-    df_melted['lag_1hr_congestion'] = df_melted.groupby(['station_id', 'line_direction_cid', 'car_number'])['congestion'].shift(12)
-    df_melted.fillna(0, inplace=True)
+    # 資料已依 (車站, 方向, 車廂, 時間) 排序，直接整體平移一次，
+    # 再以群組編號把跨群組的位置歸零，取代兩次 groupby().shift()；
+    # ngroup 為每個 (車站, 方向, 車廂) 組合配發唯一編號，不受各欄位取值數量限制
+    group_key = df_melted.groupby(
+        ['station_id', 'line_direction_cid', 'car_number'], sort=False, observed=True, dropna=False
+    ).ngroup().to_numpy()
+    congestion = df_melted['congestion'].to_numpy()
+    for lag_col, periods in (('lag_5min_congestion', 1), ('lag_1hr_congestion', 12)):
+        lag = np.zeros(len(df_melted), dtype=np.float32)
+        same_group = group_key[periods:] == group_key[:-periods]
+        lag[periods:] = np.where(same_group, congestion[:-periods], 0)
+        df_melted[lag_col] = lag
     
-    # 3. 類別特徵編碼 - 維持不變
+    # 3. 類別特徵：轉為 pandas category，交由 XGBoost 原生類別切分處理，不再做 One-Hot 展開
     categorical_features = ['station_id', 'line_direction_cid']
-    df_melted[categorical_features] = df_melted[categorical_features].astype(str)
-    
-    encoder = OneHotEncoder(handle_unknown='ignore', sparse_output=False)
-    encoded_data = encoder.fit_transform(df_melted[categorical_features])
-    encoded_df = pd.DataFrame(encoded_data, columns=encoder.get_feature_names_out(categorical_features), index=df_melted.index)
+    for col in categorical_features:
+        df_melted[col] = df_melted[col].astype(str).astype('category')
+    # 保存各類別欄位的類別清單，推論時需以相同的類別順序建立 Categorical
+    categories = {col: df_melted[col].cat.categories for col in categorical_features}
     
     # 4. 組合最終特徵
     numeric_features = [
         'hour', 'minute', 'day_of_week', 'is_weekend', 'is_peak_hour', 'is_transfer_station',
         'car_number', 'lag_5min_congestion', 'lag_1hr_congestion'
     ]
+    # 數值特徵值域都很小，降為 int8 / float32 可大幅縮小送入 XGBoost 的特徵矩陣
+    int8_features = ['hour', 'minute', 'day_of_week', 'is_weekend', 'is_peak_hour', 'is_transfer_station', 'car_number']
+    lag_features = ['lag_5min_congestion', 'lag_1hr_congestion']
+    df_melted[int8_features] = df_melted[int8_features].astype('int8')
+    df_melted[lag_features] = df_melted[lag_features].astype('float32')
     
-    final_df = pd.concat([df_melted[numeric_features].reset_index(drop=True), encoded_df.reset_index(drop=True), df_melted['congestion'].reset_index(drop=True)], axis=1)
-    feature_columns = numeric_features + list(encoder.get_feature_names_out(categorical_features))
-    
-    # 【新增】特徵縮放
-    scaler = StandardScaler()
-    final_df[numeric_features] = scaler.fit_transform(final_df[numeric_features])
+    feature_columns = numeric_features + categorical_features
+    # 最終輸出依時間排序，讓訓練端可直接以列順序切出時間序驗證集
+    # ignore_index=True 讓排序直接產生 RangeIndex，不需再另外 reset_index 複製一次
+    df_melted = df_melted.sort_values('timestamp', kind='stable', ignore_index=True)
+    # 樹模型的分裂點不受單調縮放影響，不做 StandardScaler，特徵維持 int8 / float32 原值
+    final_df = df_melted[feature_columns + ['congestion']]
     
     logger.info(f"--- 預處理完成，共生成 {len(final_df)} 筆有效訓練樣本，使用 {len(feature_columns)} 個特徵。")
-    return final_df, feature_columns, encoder, scaler
 
-def train_and_save_model(df: pd.DataFrame, feature_columns: list, line_type: str, encoder: OneHotEncoder, scaler: StandardScaler):
+    # 寫入快取，並清除同一路線的舊版快取
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for old_file in glob.glob(os.path.join(CACHE_DIR, f"{line_type}_*")):
+        os.remove(old_file)
+    final_df.to_parquet(cache_path, engine='pyarrow', compression='zstd', index=False)
+    return final_df, feature_columns, categories
+
+def _fit_candidate(base_params: dict, params: dict, X_tr: pd.DataFrame, y_tr: pd.Series, X_val: pd.DataFrame, y_val: pd.Series) -> Tuple[float, int, dict]:
+    """訓練單一超參數組合 (驗證集 mlogloss 連續 20 輪未改善即停止)，回傳 (驗證 Accuracy, 最佳樹數, 參數)。"""
+    model = xgb.XGBClassifier(**base_params, **params, n_estimators=300, early_stopping_rounds=20, n_jobs=1)
+    model.fit(X_tr, y_tr, eval_set=[(X_val, y_val)], verbose=False)
+    score = accuracy_score(y_val, model.predict(X_val))
+    return score, model.best_iteration + 1, params
+
+def train_and_save_model(df: pd.DataFrame, feature_columns: list, line_type: str, categories: Dict[str, pd.Index], n_jobs: int = -1):
     """
     【✨模型訓練與調優升級✨】
-    使用 GridSearchCV 進行超參數調優，並使用分類評估指標。
+    以時間序驗證集搭配 early stopping 進行超參數調優，並使用分類評估指標。
     """
     logger.info(f"--- 開始訓練 {line_type} 分類模型... ---")
     
     X = df[feature_columns]
-    y = df['congestion'] - 1 # 目標變數轉換為 0-indexed
+    y = (df['congestion'] - 1).astype('int8') # 目標變數轉換為 0-indexed
     
     # 使用 stratify=y 確保訓練集和測試集中的各類別比例與原始數據相同
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
@@ -118,45 +214,58 @@ def train_and_save_model(df: pd.DataFrame, feature_columns: list, line_type: str
     # 【新增】處理類別不平衡問題 (若需要)
     # 檢查 y_train 的類別分佈，如果某個類別樣本過少，可以啟用 SMOTE
     # logger.info(f"訓練集類別分佈: {np.bincount(y_train)}")
+    # from imblearn.over_sampling import SMOTE  # 啟用時才在此匯入，避免平時載入 imblearn
     # smote = SMOTE(random_state=42)
     # X_train, y_train = smote.fit_resample(X_train, y_train)
     # logger.info(f"SMOTE 處理後訓練集類別分佈: {np.bincount(y_train)}")
 
-    # 【新增】使用 GridSearchCV 進行超參數調優
-    logger.info("--- ⚙️ 開始使用 GridSearchCV 進行超參數調優... ---")
+    # 【新增】超參數調優：以「時間序上最後 20%」的訓練資料作為單一驗證窗，
+    # 每個組合只訓練一次並以 early stopping 決定樹數，取代 5 折交叉驗證的重複訓練
+    logger.info("--- ⚙️ 開始以時間序驗證集進行超參數調優... ---")
     param_grid = {
-        'n_estimators': [100, 200, 300],
         'learning_rate': [0.05, 0.1, 0.2],
         'max_depth': [3, 5, 7],
         'subsample': [0.8],
         'colsample_bytree': [0.8]
     }
-    
-    # 使用 TimeSeriesSplit 進行交叉驗證
-    tscv = TimeSeriesSplit(n_splits=5)
-    
-    xgb_model = xgb.XGBClassifier(
+    candidates = [dict(zip(param_grid, values)) for values in itertools.product(*param_grid.values())]
+
+    # 預處理輸出的列已依時間排序，train_test_split 保留原索引，排序索引即可還原時間順序
+    ordered_idx = X_train.index.sort_values()
+    cutoff = int(len(ordered_idx) * 0.8)
+    tr_idx, val_idx = ordered_idx[:cutoff], ordered_idx[cutoff:]
+    X_tr, y_tr = X_train.loc[tr_idx], y_train.loc[tr_idx]
+    X_val, y_val = X_train.loc[val_idx], y_train.loc[val_idx]
+
+    device = _detect_device()
+    logger.info(f"--- 🖥️ XGBoost 訓練裝置: {device} ---")
+    base_params = dict(
         objective='multi:softmax',
         num_class=4,
         random_state=42,
-        n_jobs=-1,
         eval_metric='mlogloss',
-        use_label_encoder=False,
+        # 調優時會大量重複訓練，關閉 XGBoost 自身的日誌輸出
+        verbosity=0,
+        # hist 只需對特徵分箱一次；lossguide 以損失下降最多的節點優先分裂，適合此類小型特徵集
+        tree_method='hist',
+        grow_policy='lossguide',
+        # 數值特徵皆為小整數域 (minute 最多 60 種取值，其餘更少)，64 個分箱即可無損表示，直方圖也縮小為 1/4
+        max_bin=64,
+        device=device,
+        enable_categorical=True,
     )
-    
-    grid_search = GridSearchCV(
-        estimator=xgb_model,
-        param_grid=param_grid,
-        scoring='accuracy',
-        cv=tscv,
-        n_jobs=-1,
-        verbose=1
+
+    # 平行化只放在組合層級，單一模型維持單執行緒，避免執行緒數平方級超額訂閱
+    results = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_fit_candidate)(base_params, params, X_tr, y_tr, X_val, y_val) for params in candidates
     )
-    
-    grid_search.fit(X_train, y_train)
-    best_model = grid_search.best_estimator_
-    
-    logger.info(f"--- ✅ 超參數調優完成，找到最佳參數組合: {grid_search.best_params_} ---")
+    best_score, best_n_estimators, best_params = max(results, key=lambda r: r[0])
+    logger.info(f"--- ✅ 超參數調優完成，找到最佳參數組合: {best_params} (樹數 {best_n_estimators}，驗證 Accuracy {best_score:.4f}) ---")
+
+    # 以最佳參數與 early stopping 選出的樹數，在完整訓練集上重新訓練最終模型；
+    # 此時只剩單一模型在訓練，改由 XGBoost 自身使用全部分配到的核心
+    best_model = xgb.XGBClassifier(**base_params, **best_params, n_estimators=best_n_estimators, n_jobs=n_jobs)
+    best_model.fit(X_train, y_train, verbose=False)
 
     # 使用最佳模型進行預測
     y_pred = best_model.predict(X_test)
@@ -176,20 +285,42 @@ def train_and_save_model(df: pd.DataFrame, feature_columns: list, line_type: str
     
     # 儲存產物
     output_dir = MODEL_DIR 
-    best_model.save_model(os.path.join(output_dir, f'{line_type}_congestion_model.json'))
-    joblib.dump(encoder, os.path.join(output_dir, f'{line_type}_encoder.joblib'))
-    joblib.dump(scaler, os.path.join(output_dir, f'{line_type}_scaler.joblib')) # 【新增】儲存 scaler
-    pd.DataFrame(feature_columns, columns=['feature']).to_csv(os.path.join(output_dir, f'{line_type}_feature_columns.csv'), index=False)
+    # 模型改存 XGBoost 的 UBJ 二進位格式，檔案更小、載入更快
+    best_model.save_model(os.path.join(output_dir, f'{line_type}_congestion_model.ubj'))
+    joblib.dump(categories, os.path.join(output_dir, f'{line_type}_categories.joblib'), compress=3)
+    with open(os.path.join(output_dir, f'{line_type}_feature_columns.json'), 'w', encoding='utf-8') as f:
+        json.dump(feature_columns, f, ensure_ascii=False)
     
     logger.info(f"      -> 模型相關產物已保存至: {output_dir}")
 
+def _train_one_line(line_type: str) -> None:
+    """完成單一路線的預處理與訓練。"""
+    filepath = os.path.join(DATA_DIR, f'{line_type}_congestion')
+    if not os.path.isdir(filepath):
+        filepath = os.path.join(DATA_DIR, f'{line_type}_congestion.csv')
+    # 路線依序訓練，調優的候選組合由 loky 使用全部核心並行
+    n_jobs = -1
+    try:
+        # 確保函數呼叫可以接收新增的回傳值
+        processed_df, features, fitted_categories = preprocess_for_training(filepath, line_type)
+        # 確保函數呼叫可以傳遞新增的參數
+        train_and_save_model(processed_df, features, line_type, fitted_categories, n_jobs=n_jobs)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error(f"--- ❌ {line_type} 訓練失敗: {e} ---")
+        logger.error("請確保已運行 data_collector.py 並收集到足夠的資料。")
+    except Exception as e:
+        logger.critical(f"--- ❌ {line_type} 訓練過程中發生未知嚴重錯誤: {e} ---", exc_info=True)
+
 if __name__ == "__main__":
     logger.warning("--- 準備開始新一輪的『分類模型』訓練。已新增自動刪除舊模型檔案功能！ ---")
     
     # 【新增功能】自動刪除舊模型檔案
-    # 尋找所有 line_type_congestion_model.json、_encoder.joblib、_feature_columns.csv、_scaler.joblib 檔案
-    old_files = glob.glob(os.path.join(MODEL_DIR, '*_congestion_model.json')) + \
+    # 尋找所有 line_type_congestion_model.ubj/.json、_encoder.joblib、_categories.joblib、_feature_columns.json/.csv 以及已不再使用的 _scaler.joblib 檔案
+    old_files = glob.glob(os.path.join(MODEL_DIR, '*_congestion_model.ubj')) + \
+                glob.glob(os.path.join(MODEL_DIR, '*_congestion_model.json')) + \
                 glob.glob(os.path.join(MODEL_DIR, '*_encoder.joblib')) + \
+                glob.glob(os.path.join(MODEL_DIR, '*_categories.joblib')) + \
+                glob.glob(os.path.join(MODEL_DIR, '*_feature_columns.json')) + \
                 glob.glob(os.path.join(MODEL_DIR, '*_feature_columns.csv')) + \
                 glob.glob(os.path.join(MODEL_DIR, '*_scaler.joblib'))
     
@@ -202,17 +333,9 @@ if __name__ == "__main__":
             except OSError as e:
                 logger.error(f"刪除檔案 {file_path} 時發生錯誤: {e}")
 
+    # 平行化只放在超參數組合這一層：loky 工作程序內再開 loky 不保證取得工作程序，
+    # 可能退回循序執行或超額訂閱 CPU，因此路線之間改為依序訓練
     for line_type in ['high_capacity', 'wenhu']:
-        filepath = os.path.join(DATA_DIR, f'{line_type}_congestion.csv')
-        try:
-            # 確保函數呼叫可以接收新增的回傳值
-            processed_df, features, fitted_encoder, fitted_scaler = preprocess_for_training(filepath, line_type)
-            # 確保函數呼叫可以傳遞新增的參數
-            train_and_save_model(processed_df, features, line_type, fitted_encoder, fitted_scaler)
-        except (FileNotFoundError, ValueError) as e:
-            logger.error(f"--- ❌ {line_type} 訓練失敗: {e} ---")
-            logger.error("請確保已運行 data_collector.py 並收集到足夠的資料。")
-        except Exception as e:
-            logger.critical(f"--- ❌ {line_type} 訓練過程中發生未知嚴重錯誤: {e} ---", exc_info=True)
+        _train_one_line(line_type)
     
     logger.info("\n--- 🎉 所有模型訓練流程結束！ ---")
\ No newline at end of file
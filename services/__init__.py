@@ -1,140 +1,179 @@
 # services/service_registry.py
 
 import logging
+import functools
+from typing import TYPE_CHECKING
 import config
 from utils.exceptions import ServiceInitializationError
-from services.tdx_service import tdx_api
-
-# --- 服務類別 Import ---
-from .fare_service import FareService
-from .routing_service import RoutingManager 
-from .station_service import StationManager 
-from .local_data_service import LocalDataManager 
-from .lost_and_found_service import LostAndFoundService
-from .metro_soap_service import MetroSoapService
-from .prediction_service import CongestionPredictor 
-from .first_last_train_time_service import FirstLastTrainTimeService 
-from .realtime_mrt_service import RealtimeMRTService 
+
+# --- 服務類別只在型別檢查時匯入；實際匯入延後到第一次取用該服務時，避免 import services 就載入全部模組 ---
+if TYPE_CHECKING:
+    from .fare_service import FareService
+    from .routing_service import RoutingManager
+    from .station_service import StationManager
+    from .local_data_service import LocalDataManager
+    from .lost_and_found_service import LostAndFoundService
+    from .metro_soap_service import MetroSoapService
+    from .prediction_service import CongestionPredictor
+    from .first_last_train_time_service import FirstLastTrainTimeService
+    from .realtime_mrt_service import RealtimeMRTService
+    from .tdx_service import TDXApi
 
 # 設定日誌記錄器
 logger = logging.getLogger(__name__)
 
+def _lazy_service(factory):
+    """
+    將服務建構函式包成只在第一次存取時執行的 cached_property，
+    建構失敗時統一轉為 ServiceInitializationError。
+    """
+    @functools.wraps(factory)
+    def wrapper(self):
+        logger.info(f"Initializing service: {factory.__name__}...")
+        try:
+            return factory(self)
+        except ServiceInitializationError:
+            raise
+        except Exception as e:
+            logger.error(f"服務 {factory.__name__} 初始化失敗: {e}", exc_info=True)
+            raise ServiceInitializationError(f"核心服務初始化失敗 ({factory.__name__}): {e}")
+    return functools.cached_property(wrapper)
+
 class ServiceRegistry:
     """
     一個集中管理所有業務服務實例的註冊中心。
-    採用單例模式，確保整個應用程式共享同一組服務實例。
+    採用單例模式，確保整個應用程式共享同一組服務實例；
+    各服務在第一次被取用時才匯入並初始化 (例如只用到 SOAP 服務的程式不會載入預測模型)。
     """
     _instance = None
-    _is_initialized = False
-
-    # --- 服務實例的類型提示 ---
-    local_data_manager: LocalDataManager
-    station_manager: StationManager
-    tdx_api: tdx_api 
-    metro_soap_service: MetroSoapService 
-    fare_service: FareService
-    routing_manager: RoutingManager
-    lost_and_found_service: LostAndFoundService
-    congestion_predictor: CongestionPredictor
-    first_last_train_time_service: FirstLastTrainTimeService 
-    realtime_mrt_service: RealtimeMRTService 
 
     def __new__(cls):
         if cls._instance is None:
             logger.info("Creating new ServiceRegistry instance.")
             cls._instance = super(ServiceRegistry, cls).__new__(cls)
-            if not cls._is_initialized:
-                cls._instance._initialize_services()
-                cls._is_initialized = True
         return cls._instance
 
-    def _initialize_services(self):
-        """
-        在應用啟動時，載入所有資料並初始化所有服務。
-        """
-        logger.info("Initializing services...")
-        try:
-            # 1. 初始化無依賴或基礎服務
-            self.local_data_manager = LocalDataManager()
-            from .station_service import station_manager as sm_instance
-            self.station_manager = sm_instance 
-            
-            from services.tdx_service import tdx_api as tdx_api_instance
-            self.tdx_api = tdx_api_instance 
-            
-            # 2. 初始化需要配置的服務 (如 SOAP Service)
-            self.metro_soap_service = MetroSoapService(
-                username=config.METRO_API_USERNAME,
-                password=config.METRO_API_PASSWORD
-            )
-
-            # 3. 初始化依賴其他服務的服務
-            self.fare_service = FareService(
-                fare_data=self.local_data_manager.fares,
-                station_id_map=self.station_manager.station_map # 更正為使用 station_manager 的 ID 對應
-            )
-            
-            self.routing_manager = RoutingManager(
-                station_manager_instance=self.station_manager,
-                metro_soap_service_instance=self.metro_soap_service,
-                tdx_api_instance=self.tdx_api 
-            )
-            
-            self.lost_and_found_service = LostAndFoundService(
-                metro_soap_service=self.metro_soap_service
-            )
-
-            self.congestion_predictor = CongestionPredictor(
-                station_manager_instance=self.station_manager
-            )
-
-            # 【重點修正】初始化 FirstLastTrainTimeService
-            # 將 timetable_data_path 指向 CSV 檔案路徑
-            from .first_last_train_time_service import FirstLastTrainTimeService as fltt_service
-            self.first_last_train_time_service = fltt_service(
-                data_file_path=config.FIRST_LAST_TIMETABLE_DATA_PATH, # <--- 這裡已經修正為 CSV 路徑！
-                station_manager=self.station_manager
-            )
-
-            self.realtime_mrt_service = RealtimeMRTService(
-                metro_soap_api=self.metro_soap_service,
-                station_manager=self.station_manager
-            )
-            self.realtime_mrt_service.start_update_thread() 
-
-            logger.info("All services initialized successfully.")
-        except Exception as e:
-            logger.error(f"服務初始化失敗: {e}", exc_info=True)
-            raise ServiceInitializationError(f"核心服務初始化失敗: {e}")
-
-    def get_fare_service(self) -> FareService:
+    # 1. 無依賴或基礎服務
+    @_lazy_service
+    def local_data_manager(self) -> 'LocalDataManager':
+        from .local_data_service import LocalDataManager
+        return LocalDataManager()
+
+    @_lazy_service
+    def station_manager(self) -> 'StationManager':
+        from .station_service import station_manager as sm_instance
+        return sm_instance
+
+    @_lazy_service
+    def tdx_api(self) -> 'TDXApi':
+        from .tdx_service import tdx_api as tdx_api_instance
+        return tdx_api_instance
+
+    # 2. 需要配置的服務 (如 SOAP Service)
+    @_lazy_service
+    def metro_soap_service(self) -> 'MetroSoapService':
+        # 與 congestion_collecter 等模組共用同一個實例 (連線池、執行緒池與快取)
+        from .metro_soap_service import get_metro_soap_api
+        return get_metro_soap_api()
+
+    # 3. 依賴其他服務的服務
+    @_lazy_service
+    def fare_service(self) -> 'FareService':
+        from .fare_service import FareService
+        return FareService(
+            fare_data=self.local_data_manager.fares,
+            station_id_map=self.station_manager.station_map # 更正為使用 station_manager 的 ID 對應
+        )
+
+    @_lazy_service
+    def routing_manager(self) -> 'RoutingManager':
+        from .routing_service import RoutingManager
+        return RoutingManager(
+            station_manager_instance=self.station_manager,
+            metro_soap_service_instance=self.metro_soap_service,
+            tdx_api_instance=self.tdx_api
+        )
+
+    @_lazy_service
+    def lost_and_found_service(self) -> 'LostAndFoundService':
+        from .lost_and_found_service import LostAndFoundService
+        service = LostAndFoundService(
+            metro_soap_service=self.metro_soap_service
+        )
+        service.start_refresh_thread()
+        return service
+
+    @_lazy_service
+    def congestion_predictor(self) -> 'CongestionPredictor':
+        from .prediction_service import CongestionPredictor
+        return CongestionPredictor(
+            station_manager_instance=self.station_manager
+        )
+
+    @_lazy_service
+    def first_last_train_time_service(self) -> 'FirstLastTrainTimeService':
+        # 將 timetable_data_path 指向 CSV 檔案路徑
+        from .first_last_train_time_service import FirstLastTrainTimeService
+        return FirstLastTrainTimeService(
+            data_file_path=config.FIRST_LAST_TIMETABLE_DATA_PATH,
+            station_manager=self.station_manager
+        )
+
+    @_lazy_service
+    def realtime_mrt_service(self) -> 'RealtimeMRTService':
+        from .realtime_mrt_service import RealtimeMRTService
+        service = RealtimeMRTService(
+            metro_soap_api=self.metro_soap_service,
+            station_manager=self.station_manager
+        )
+        service.start_update_thread()
+        return service
+
+    def shutdown(self) -> None:
+        """停止已啟動的背景線程並釋放 SOAP 連線池與執行緒池；只處理已初始化的服務。"""
+        if 'lost_and_found_service' in self.__dict__:
+            self.lost_and_found_service.stop_refresh_thread()
+        if 'realtime_mrt_service' in self.__dict__:
+            self.realtime_mrt_service.stop_update_thread()
+        from .metro_soap_service import close_metro_soap_api
+        close_metro_soap_api()
+        # 清除所有已初始化的服務 (cached_property 存於實例字典)，之後再取用時重新建立，不會拿到持有已關閉實例的服務
+        self.__dict__.clear()
+        logger.info("ServiceRegistry shut down.")
+
+    def get_fare_service(self) -> 'FareService':
         return self.fare_service
 
-    def get_routing_manager(self) -> RoutingManager:
+    def get_routing_manager(self) -> 'RoutingManager':
         return self.routing_manager
-    
-    def get_station_manager(self) -> StationManager:
+
+    def get_station_manager(self) -> 'StationManager':
         return self.station_manager
 
-    def get_local_data_manager(self) -> LocalDataManager:
+    def get_local_data_manager(self) -> 'LocalDataManager':
         return self.local_data_manager
 
-    def get_tdx_api(self): 
+    def get_tdx_api(self) -> 'TDXApi':
         return self.tdx_api
 
-    def get_lost_and_found_service(self) -> LostAndFoundService:
+    def get_lost_and_found_service(self) -> 'LostAndFoundService':
         return self.lost_and_found_service
 
-    def get_metro_soap_service(self) -> MetroSoapService:
+    def get_metro_soap_service(self) -> 'MetroSoapService':
         return self.metro_soap_service
 
-    def get_congestion_predictor(self) -> CongestionPredictor:
+    def get_congestion_predictor(self) -> 'CongestionPredictor':
         return self.congestion_predictor
 
-    def get_first_last_train_time_service(self) -> FirstLastTrainTimeService:
+    def get_first_last_train_time_service(self) -> 'FirstLastTrainTimeService':
         return self.first_last_train_time_service
 
-    def get_realtime_mrt_service(self) -> RealtimeMRTService:
+    def get_realtime_mrt_service(self) -> 'RealtimeMRTService':
         return self.realtime_mrt_service
 
-service_registry = ServiceRegistry()
\ No newline at end of file
+def get_registry() -> ServiceRegistry:
+    """取得全域唯一的 ServiceRegistry；建立本身不會初始化任何服務。"""
+    return ServiceRegistry()
+
+# 保留模組層級實例以相容既有的 `from services import service_registry`；建立成本僅為一個空物件
+service_registry = get_registry()
@@ -2,6 +2,8 @@
 
 from datetime import datetime, timedelta
 import logging
+import threading
+import time
 from .metro_soap_service import MetroSoapService
 
 logger = logging.getLogger(__name__)
@@ -10,11 +12,73 @@ class LostAndFoundService:
     """
     負責處理所有與遺失物相關的業務邏輯。
     【已重構】此服務現在透過注入的 MetroSoapService 來獲取更全面的官方遺失物資料。
+    遺失物資料每天至多更新數次，由背景線程定期刷新並保存在記憶體中，使用者查詢時直接篩選快取。
     """
-    def __init__(self, metro_soap_service: MetroSoapService):
+    def __init__(self, metro_soap_service: MetroSoapService, refresh_interval_seconds: int = 600):
         self.metro_soap_service = metro_soap_service
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self._cached_items: list[dict] = []
+        self._cache_time: float = 0.0 # time.monotonic() 的時間點；0 表示尚未成功取得資料
+        self._stop_event = threading.Event()
+        self._refresh_thread: threading.Thread | None = None
+        # 每次刷新都會下載完整資料集，以鎖確保同一時間只有一個線程在刷新
+        self._refresh_lock = threading.Lock()
         logger.info("LostAndFoundService initialized with MetroSoapService.")
 
+    def start_refresh_thread(self):
+        """啟動背景線程，每 refresh_interval_seconds 秒向 SOAP API 取得完整遺失物資料。"""
+        if self._refresh_thread is None or not self._refresh_thread.is_alive():
+            self._stop_event.clear()
+            self._refresh_thread = threading.Thread(target=self._periodic_refresh, daemon=True)
+            self._refresh_thread.start()
+            logger.info(f"--- LostAndFoundService 背景刷新線程已啟動，每 {self.refresh_interval_seconds} 秒更新一次 ---")
+
+    def stop_refresh_thread(self):
+        if self._refresh_thread is not None:
+            self._stop_event.set()
+            self._refresh_thread.join(timeout=5)
+            self._refresh_thread = None
+            logger.info("--- LostAndFoundService 背景刷新線程已停止 ---")
+
+    def _periodic_refresh(self):
+        while not self._stop_event.is_set():
+            with self._refresh_lock:
+                self._refresh_cache()
+            self._stop_event.wait(self.refresh_interval_seconds)
+
+    def _is_stale(self) -> bool:
+        return not self._cache_time or time.monotonic() - self._cache_time > self.refresh_interval_seconds
+
+    def _refresh_cache(self) -> bool:
+        """向 SOAP API 取得完整遺失物資料並更新快取；失敗時保留舊資料繼續提供查詢。"""
+        try:
+            items = self.metro_soap_service.get_all_lost_items_soap()
+        except Exception as e:
+            logger.error(f"--- ❌ [LostAndFoundService] 刷新遺失物快取時發生錯誤: {e} ---", exc_info=True)
+            return False
+        if not items:
+            logger.warning("--- ⚠️ [LostAndFoundService] 刷新時未取得任何遺失物資料，沿用現有快取。 ---")
+            return False
+        # 以單一指派替換整份列表，查詢端不需加鎖即可讀到完整的一份資料
+        self._cached_items, self._cache_time = items, time.monotonic()
+        logger.info(f"--- ✅ [LostAndFoundService] 遺失物快取已刷新，共 {len(items)} 筆。 ---")
+        return True
+
+    def _get_all_items(self) -> list[dict]:
+        """
+        取得完整遺失物資料：快取在刷新週期內直接回傳；已有資料且背景線程運作中時，
+        即使過期也直接回傳舊資料，交由背景線程刷新。只有尚無資料或背景線程未啟動時才同步刷新一次。
+        """
+        if not self._is_stale():
+            return self._cached_items
+        if self._cached_items and self._refresh_thread is not None and self._refresh_thread.is_alive():
+            return self._cached_items
+        with self._refresh_lock:
+            # 等待鎖期間其他線程可能已完成刷新，再檢查一次避免重複下載完整資料集
+            if self._is_stale():
+                self._refresh_cache()
+        return self._cached_items
+
     def query_items(self, station_name: str | None = None, item_name: str | None = None, days_ago: int = 7) -> list:
         """
         從官方 SOAP API 查詢捷運遺失物。
@@ -30,8 +94,8 @@ class LostAndFoundService:
         logger.info(f"--- [LostAndFoundService] 透過 SOAP API 查詢遺失物: 車站={station_name}, 物品={item_name}, 過去={days_ago}天 ---")
         
         try:
-            # 1. 從 SOAP Service 獲取所有資料
-            all_items = self.metro_soap_service.get_all_lost_items_soap()
+            # 1. 從快取取得所有資料 (由背景線程定期向 SOAP Service 刷新)
+            all_items = self._get_all_items()
             if not all_items:
                 logger.warning("--- [LostAndFoundService] 從 SOAP API 未獲取到任何遺失物資料。 ---")
                 return []
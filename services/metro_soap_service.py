@@ -1,15 +1,111 @@
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.request import ACCEPT_ENCODING
+from lxml import etree
+import re
 import json
+try:
+    # orjson 以 Rust 實作，解析大型 JSON 陣列約快 2-3 倍；未安裝時退回標準函式庫
+    import orjson as _json_lib
+except ImportError:
+    _json_lib = json
 import logging
+import functools
 import config
-import re # 引入正則表達式模組
+from utils.cache import ttl_cache, cache_identity
 import csv
-from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from typing import Callable, Iterator
 
 # 配置日誌記錄
 logger = logging.getLogger(__name__)
 
+# 共用的 lxml 解析器 (libxml2 C 實作)；關閉外部實體解析，避免回應內容觸發 XXE
+_XML_PARSER = etree.XMLParser(resolve_entities=False, no_network=True)
+
+# 預先編譯的 XPath，避免每次回應都重新走訪或編譯查詢
+_XPATH_NS = {
+    'soap': 'http://schemas.xmlsoap.org/soap/envelope/',
+    'diffgr': 'urn:schemas-microsoft-com:xml-diffgram-v1'
+}
+_XP_SOAP_RESULT = etree.XPath("/soap:Envelope/soap:Body/*/*[local-name()=$tag]", namespaces=_XPATH_NS)
+_XP_ANY_BY_NAME = etree.XPath("//*[local-name()=$tag]")
+
+# SOAP 信封的固定前後段預先編碼為 bytes，每次呼叫只需拼接方法名稱與參數
+_ENVELOPE_HEAD = (b'<?xml version="1.0" encoding="utf-8"?>\n'
+                  b'<soap:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+                  b'xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">\n  <soap:Body>\n    <')
+_ENVELOPE_TAIL = b'>\n  </soap:Body>\n</soap:Envelope>'
+
+# 連線逾時與讀取逾時分開設定：DNS/TLS 卡住時 3 秒內放棄，回應較慢時仍保留足夠的讀取時間
+_CONNECT_TIMEOUT = 3.05
+_READ_TIMEOUT = 10
+# 遺失物等資料集端點需由伺服器端彙整大量資料，第一個位元組前的等待時間較長
+_DATASET_READ_TIMEOUT = 30
+
+def _slice_json_array(text: str | bytes) -> str | bytes | None:
+    """
+    取出回應中第一個 '[' 到最後一個 ']' 之間的 JSON 陣列 (回應前後可能混有 SOAP XML 標籤)。
+    以 C 實作的 find / rfind 定位，不需要正規表示式回溯掃描整份回應；str 與 bytes 皆可。
+    """
+    is_bytes = isinstance(text, bytes)
+    start = text.find(b'[' if is_bytes else '[')
+    end = text.rfind(b']' if is_bytes else ']')
+    if start == -1 or end <= start + 1:
+        return None
+    return text[start:end + 1]
+
+def _extract_result_bytes(body: bytes, result_tag: str) -> bytes | None:
+    """
+    不建立 XML 樹，直接以 bytes.find 切出 <result_tag>...</result_tag> 之間的文字並還原五個預先定義的實體。
+    結果節點帶有屬性或前綴、或內容含數字字元參照 / CDATA 時回傳 None，由呼叫端改用 lxml 解析。
+    """
+    open_tag = b'<' + result_tag.encode('ascii') + b'>'
+    start = body.find(open_tag)
+    if start == -1:
+        return None
+    start += len(open_tag)
+    end = body.find(b'</' + result_tag.encode('ascii') + b'>', start)
+    if end == -1:
+        return None
+    text = body[start:end]
+    if b'&#' in text or b'<![CDATA[' in text:
+        return None
+    if b'&' in text:
+        # &amp; 必須最後還原，避免 "&amp;lt;" 被還原兩次
+        text = text.replace(b'&lt;', b'<').replace(b'&gt;', b'>').replace(b'&quot;', b'"').replace(b'&apos;', b"'").replace(b'&amp;', b'&')
+    return text
+
+_JSON_DECODER = json.JSONDecoder()
+
+def _decode_leading_json_array(text: str | bytes):
+    """
+    以標準函式庫 (C 加速) 的 raw_decode 解析開頭的一個 JSON 值並忽略其後的內容；
+    線性掃描、不回溯，作為切片後仍無法解析時的備援。
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    return _JSON_DECODER.raw_decode(text, text.find('['))[0]
+
+def _preview(text: str | bytes, limit: int) -> str:
+    """截取回應開頭供日誌顯示；bytes 以 UTF-8 寬鬆解碼。"""
+    text = text[:limit]
+    return text.decode('utf-8', errors='replace') if isinstance(text, bytes) else text
+
+# XML 特殊字元的跳脫表；以預先編譯的 bytes 正規表示式一次替換，只在確實含有特殊字元時才重建字串
+_XML_SPECIAL_CHARS = re.compile(rb'[&<>"\']')
+_XML_ESCAPES = {b'&': b'&amp;', b'<': b'&lt;', b'>': b'&gt;', b'"': b'&quot;', b"'": b'&apos;'}
+
+def _xml_escape(value) -> bytes:
+    """將參數值編碼為 UTF-8 並跳脫 XML 特殊字元，避免使用者輸入破壞 SOAP 結構 (XML injection)。"""
+    return _XML_SPECIAL_CHARS.sub(lambda m: _XML_ESCAPES[m.group()], str(value).encode('utf-8'))
+
+def _soap_envelope(method: bytes, params: bytes = b'') -> bytes:
+    """組出呼叫 tempuri.org 命名空間下 method 的 SOAP 請求主體 (UTF-8 bytes)。"""
+    return b''.join((_ENVELOPE_HEAD, method, b' xmlns="http://tempuri.org/">', params, b'</', method, _ENVELOPE_TAIL))
+
 class MetroSoapService:
     """
     提供與台北捷運 SOAP API 互動的服務。
@@ -23,6 +119,16 @@ class MetroSoapService:
         """
         self.username = username
         self.password = password
+        # 車站列表不需帳密，因此缺少帳密時不在建構時拋出例外，只預先算好旗標供需要帳密的端點檢查
+        self._has_credentials = bool(username and password)
+        self._cache_identity = cache_identity(username, password)
+        # 帳密在實例存續期間不變，預先組好多數端點共用的參數片段，以及各無參數端點的完整請求主體
+        self._credential_params = b''.join((b'<userName>', _xml_escape(username), b'</userName><passWord>', _xml_escape(password), b'</passWord>'))
+        self._prebuilt_bodies = {
+            method: _soap_envelope(method.encode('ascii'), self._credential_params)
+            for method in ('getCarWeightByInfoEx', 'getCarWeightBRInfo', 'getTrackInfo', 'getLoseThingForWeb_ALL')
+        }
+        self._prebuilt_bodies['GetStationList'] = _soap_envelope(b'GetStationList')
         self.api_endpoints = {
             "LoseThing": "http://api.metro.taipei/metroapi/LoseThingForWeb.asmx",
             "RouteControl": "http://ws.metro.taipei/trtcBeaconBE/RouteControl.asmx",
@@ -40,14 +146,30 @@ class MetroSoapService:
             'diffgr': 'urn:schemas-microsoft-com:xml-diffgram-v1',
             'msdata': 'urn:schemas-microsoft-com:xml-msdata'
         }
-
-    def _send_soap_request(self, endpoint_key: str, soap_action: str, soap_body: str) -> requests.Response | None:
+        # 各端點只分布在 api.metro.taipei 與 ws.metro.taipei 兩台主機，共用 Session 讓輪詢呼叫沿用已建立的連線
+        self.session = requests.Session()
+        # 這些 SOAP 端點皆為唯讀查詢，連線失敗與閘道暫時性錯誤時可安全地以 POST 重送；
+        # read=False 讓讀取逾時不重送、直接拋出 ReadTimeout，回應緩慢時不會把等待時間放大數倍
+        retry_policy = Retry(total=2, read=False, backoff_factor=0.3, status_forcelist=[502, 503, 504],
+                             allowed_methods=frozenset({'POST'}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry_policy)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # 冗長的 SOAP XML 壓縮率很高；ACCEPT_ENCODING 會依已安裝的套件自動加入 br / zstd，回應由 urllib3 以 C 實作解壓
+        self.session.headers.update({'Content-Type': 'text/xml; charset=utf-8', 'Accept-Encoding': ACCEPT_ENCODING})
+        # 彼此獨立的端點可並行呼叫，總延遲由各次往返的總和降為其中最慢的一次
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='metro-soap')
+
+    def _send_soap_request(self, endpoint_key: str, soap_action: str, soap_body: str | bytes, stream: bool = False,
+                           read_timeout: float = _READ_TIMEOUT) -> requests.Response | None:
         """
         通用的 SOAP 請求函式，發送請求並返回原始的 requests.Response 物件。
         不再在此函式內進行 XML 或 JSON 解析。
         :param endpoint_key: API 端點在 self.api_endpoints 中的鍵。
         :param soap_action: SOAPAction HTTP 標頭的值。
-        :param soap_body: SOAP 請求的 XML 主體字串。
+        :param soap_body: SOAP 請求的 XML 主體 (字串或已編碼的 UTF-8 bytes)。
+        :param stream: 為 True 時不預先讀取回應內容，供呼叫端以 response.raw 串流解析 (用完需自行 close)。
+        :param read_timeout: 讀取逾時秒數 (每次等待資料的上限，而非整體下載時間)。
         :return: 原始的 requests.Response 物件或 None (如果發生錯誤)。
         """
         api_url = self.api_endpoints.get(endpoint_key)
@@ -55,18 +177,26 @@ class MetroSoapService:
             logger.error(f"❌ 錯誤：找不到名為 '{endpoint_key}' 的 API 端點設定。")
             return None
 
-        headers = {
-            'Content-Type': 'text/xml; charset=utf-8',
-            'SOAPAction': soap_action
-        }
+        headers = {'SOAPAction': soap_action}
+        if isinstance(soap_body, str):
+            soap_body = soap_body.encode('utf-8')
         try:
-            logger.info(f"🚀 正在呼叫 {soap_action} (URL: {api_url})...")
-            response = requests.post(api_url, data=soap_body.encode('utf-8'), headers=headers, timeout=60)
+            # 成功路徑的日誌降為 DEBUG 並延遲格式化：輪詢端點時在預設 INFO 等級下幾乎零成本
+            logger.debug("🚀 正在呼叫 %s (URL: %s)...", soap_action, api_url)
+            response = self.session.post(api_url, data=soap_body, headers=headers, timeout=(_CONNECT_TIMEOUT, read_timeout), stream=stream)
             response.raise_for_status()  # 檢查 HTTP 狀態碼，如果不是 2xx 則拋出異常
-            logger.info(f"✅ 呼叫 {soap_action} 成功。")
+            logger.debug("✅ 呼叫 %s 成功 (Content-Encoding: %s)。", soap_action, response.headers.get('Content-Encoding', 'identity'))
             return response
-        except requests.exceptions.Timeout:
-            logger.error(f"❌ 呼叫 SOAP API 超時 (URL: {api_url}, Action: {soap_action})。")
+        except requests.exceptions.ConnectTimeout:
+            logger.error(f"❌ 連線至 SOAP API 逾時 ({_CONNECT_TIMEOUT} 秒內未建立連線；URL: {api_url}, Action: {soap_action})。")
+            return None
+        except requests.exceptions.ReadTimeout:
+            logger.error(f"❌ SOAP API 回應逾時 ({read_timeout} 秒內未收到資料；URL: {api_url}, Action: {soap_action})。")
+            return None
+        except requests.HTTPError as e:
+            # 串流模式下未讀取的回應不會自動歸還連線，需明確關閉，否則連續的 5xx 會耗盡連線池
+            e.response.close()
+            logger.error(f"❌ 呼叫 SOAP API 時發生 HTTP 錯誤 (URL: {api_url}, Action: {soap_action}): {e}", exc_info=True)
             return None
         except requests.RequestException as e:
             logger.error(f"❌ 呼叫 SOAP API 時發生網路或 HTTP 錯誤 (URL: {api_url}, Action: {soap_action}): {e}", exc_info=True)
@@ -75,23 +205,22 @@ class MetroSoapService:
             logger.error(f"❌ 呼叫 SOAP API 時發生未知錯誤 (URL: {api_url}, Action: {soap_action}): {e}", exc_info=True)
             return None
 
-    def _xml_to_dict(self, element: ET.Element) -> dict | str | None:
+    def _xml_to_dict(self, element: etree._Element) -> dict | str | None:
         """
         遞歸地將 XML Element 轉換為 Python 字典。
         會處理命名空間並將標籤名清理為無命名空間的形式。
         :param element: 要轉換的 XML 元素。
         :return: 轉換後的字典、字串（如果是葉節點）或 None。
         """
-        # 清理標籤名稱，移除命名空間
-        tag = element.tag.split('}')[-1]
-
         # 如果沒有子元素，返回其文本內容
-        if not list(element):
+        if len(element) == 0:
             return element.text.strip() if element.text else ""
 
         result = {}
-        for child in element:
-            child_tag = child.tag.split('}')[-1]
+        # 只走訪元素節點 (略過註解等)，單次走訪即取得所有子節點
+        for child in element.iterchildren(tag=etree.Element):
+            # 清理標籤名稱，移除命名空間
+            child_tag = child.tag.rpartition('}')[2]
             child_value = self._xml_to_dict(child)
 
             if child_tag in result:
@@ -103,381 +232,335 @@ class MetroSoapService:
                 result[child_tag] = child_value
         return result
 
-    def _extract_soap_body_content_xml_element(self, root: ET.Element, result_tag: str) -> ET.Element | None:
+    def _row_to_dict(self, row: etree._Element) -> dict:
+        """
+        將 DataSet 的一列 (子元素皆為不重複的葉節點) 以單次走訪轉為字典；
+        遇到巢狀或重複的欄位時退回通用的 _xml_to_dict。
+        """
+        item = {}
+        for child in row.iterchildren(tag=etree.Element):
+            key = child.tag.rpartition('}')[2]
+            if len(child) or key in item:
+                return self._xml_to_dict(row)
+            text = child.text
+            item[key] = text.strip() if text else ""
+        return item
+
+    def _extract_soap_body_content_xml_element(self, root: etree._Element, result_tag: str) -> etree._Element | None:
         """
         從 SOAP Envelope 中提取 Body 內容中指定 result_tag 的 XML 元素。
         用於標準 SOAP XML 回應。
         :param root: SOAP 回應的根 XML 元素。
         :param result_tag: 期望的結果標籤名（不包含命名空間）。
-        :return: 包含結果的 XML 元素 (ET.Element) 或 None。
+        :return: 包含結果的 XML 元素 (etree._Element) 或 None。
         """
-        # 尋找 soap:Body 元素
-        soap_body = root.find('soap:Body', self.namespaces)
-        if soap_body is None:
-            logger.warning("⚠️ 警告：SOAP 回應中找不到 Body 標籤。")
-            return None
-        
-        # 尋找 soap:Body 下的第一個子元素，通常是 API 的回應包裝元素
-        response_wrapper = soap_body[0] if len(soap_body) > 0 else None
-        if response_wrapper is None:
-            logger.warning("⚠️ 警告：SOAP Body 中沒有回應內容。")
-            return None
-            
-        # 尋找該回應包裝元素下的目標 result_tag 元素
-        # 使用 find 而不是 iter，因為通常 result_tag 是直接子元素
-        target_element = response_wrapper.find(f'{{http://tempuri.org/}}{result_tag}')
-        
-        if target_element is None:
-            logger.warning(f"⚠️ 警告：API 回應中找不到預期的 '{result_tag}' 標籤。")
-            # 為了確保涵蓋所有情況，如果直接查找不到，可以嘗試遍歷其子元素（但通常不應該這樣）
-            for element in response_wrapper.iter():
-                if element.tag.split('}')[-1] == result_tag:
-                    return element
-        return target_element
+        # 通常 result_tag 是 soap:Body 下回應包裝元素的直接子元素
+        matches = _XP_SOAP_RESULT(root, tag=result_tag)
+        if matches:
+            return matches[0]
+
+        logger.warning(f"⚠️ 警告：API 回應中找不到預期的 '{result_tag}' 標籤。")
+        # 為了確保涵蓋所有情況，如果直接查找不到，改為搜尋整份文件（但通常不應該這樣）
+        matches = _XP_ANY_BY_NAME(root, tag=result_tag)
+        return matches[0] if matches else None
 
-    def _parse_dataset_xml_string(self, xml_string: str) -> list[dict] | None:
+    def _iter_dataset_rows(self, xml_bytes: bytes) -> Iterator[dict]:
+        """
+        以 iterparse 逐列解析 diffgram 的 NewDataSet/Table，每列轉成字典後立即釋放節點，
+        記憶體用量不隨資料筆數成長。
+        :param xml_bytes: 包含 diffgram 結構的 XML (UTF-8 bytes)。
+        :return: 逐列產生的資料字典。
+        """
+        # 注意：這裡的 'Table' 元素通常沒有命名空間
+        context = etree.iterparse(BytesIO(xml_bytes), events=('end',), tag='Table', resolve_entities=False, no_network=True)
+        for _, table_element in context:
+            parent = table_element.getparent()
+            # diffgr:before 等區塊也可能出現 Table，只取 NewDataSet 底下的資料列
+            if parent is not None and parent.tag == 'NewDataSet':
+                yield self._row_to_dict(table_element)
+            table_element.clear()
+            # 一併移除已處理過的兄弟節點，避免根節點持續累積空元素
+            while table_element.getprevious() is not None:
+                del parent[0]
+
+    def _parse_dataset_xml_string(self, xml_string: str | bytes) -> list[dict] | None:
         """
         輔助函式：解析內嵌的 `diffgr:diffgram` 結構的 XML 字串。
         這種結構常見於遺失物和車站列表 API。
-        :param xml_string: 包含 diffgram 結構的 XML 字串。
+        :param xml_string: 包含 diffgram 結構的 XML 字串 (或 UTF-8 bytes)。
         :return: 轉換後的資料列表或 None。
         """
         if not xml_string:
             return None
         try:
-            root = ET.fromstring(xml_string)
-            new_data_set = root.find('diffgr:diffgram/NewDataSet', self.namespaces)
-            if new_data_set:
-                items = []
-                # 注意：這裡的 'Table' 元素通常沒有命名空間
-                for table_element in new_data_set.findall('Table'):
-                    items.append(self._xml_to_dict(table_element))
-                
-                if items:
-                    return items
+            # lxml 不接受帶有 encoding 宣告的 str，統一以 UTF-8 bytes 解析
+            if isinstance(xml_string, str):
+                xml_string = xml_string.encode('utf-8')
+            items = list(self._iter_dataset_rows(xml_string))
+            if items:
+                return items
             logger.warning("⚠️ 警告：無法從內嵌 XML 字串中解析出有效的資料集 (NewDataSet/Table)。")
             return None
-        except ET.ParseError as e:
+        except etree.XMLSyntaxError as e:
             logger.error(f"❌ 從內嵌 XML 字串解析 diffgram 時發生錯誤: {e}", exc_info=True)
             return None
         except Exception as e:
             logger.error(f"❌ 處理內嵌 diffgram XML 字串時發生未知錯誤: {e}", exc_info=True)
             return None
 
-    # --- API 功能實現 ---
+    def close(self):
+        """釋放連線池與並行呼叫用的執行緒池；全域實例請改用 close_metro_soap_api()，以一併清除單例快取。"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
 
-    def get_high_capacity_car_weight_info(self) -> list[dict] | None:
+    def fetch_many(self, calls: dict[str, Callable[[], object]]) -> dict[str, object]:
         """
-        獲取高運量線車廂擁擠度資料。API 名稱: getCarWeightByInfoEx
-        此 API 的實際回應是**直接的 JSON 字串**，而非 SOAP XML。
+        並行執行多個互不相依的 API 呼叫，並以相同的鍵回傳各自的結果。
+        :param calls: 鍵 -> 無參數的呼叫函式，例如 {"wenhu": self.get_wenhu_car_weight_info}。
+        :return: 鍵 -> 呼叫結果；發生例外的呼叫其結果為 None。
+        """
+        futures = {key: self._executor.submit(call) for key, call in calls.items()}
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                logger.error(f"❌ 並行呼叫 {key} 時發生錯誤: {e}", exc_info=True)
+                results[key] = None
+        return results
+
+    def _call_json_array(self, endpoint_key: str, method: str, label: str, result_tag: str | None = None) -> list | None:
+        """
+        呼叫只需帳密參數的端點，並解析回應中的 JSON 陣列。各 JSON 類端點共用此實作。
+        :param endpoint_key: API 端點在 self.api_endpoints 中的鍵。
+        :param method: SOAP 方法名稱 (同時用於 SOAPAction)。
+        :param label: 日誌中顯示的資料名稱。
+        :param result_tag: JSON 陣列內嵌於該 SOAP 結果節點時指定；為 None 表示回應本身即為 JSON。
+        :return: 解析後的 JSON 陣列或 None。
         """
-        if not self.username or not self.password:
-            logger.error("❌ 錯誤：缺少台北捷運 API 的帳號或密碼，無法獲取高運量線車廂擁擠度資料。")
+        if not self._has_credentials:
+            logger.error(f"❌ 錯誤：缺少台北捷運 API 的帳號或密碼，無法獲取{label}。")
             return None
 
-        body = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="{self.namespaces['xsi']}" xmlns:xsd="{self.namespaces['xsd']}" xmlns:soap="{self.namespaces['soap']}">
-  <soap:Body>
-    <getCarWeightByInfoEx xmlns="{self.namespaces['tempuri']}">
-      <userName>{self.username}</userName>
-      <passWord>{self.password}</passWord>
-    </getCarWeightByInfoEx>
-  </soap:Body>
-</soap:Envelope>"""
-
-        response = self._send_soap_request("HighCapacityCarWeight", f'"{self.namespaces["tempuri"]}getCarWeightByInfoEx"', body)
+        body = self._prebuilt_bodies[method]
+        response = self._send_soap_request(endpoint_key, f'"{self.namespaces["tempuri"]}{method}"', body)
         if response is None:
             return None
-        
+
+        raw_text = ""
         try:
-            # 直接嘗試將 response.text 解析為 JSON
-            json_str = response.text.strip()
-            
-            if not json_str:
-                logger.warning("⚠️ 警告：高運量線 API 回應為空或不包含可解析的 JSON 字串。")
+            if result_tag is None:
+                # 回應本身即為 JSON，但可能混有 SOAP XML 的標籤；直接在 bytes 上定位並解析，省去整份回應的 str 解碼
+                raw_text = response.content.strip()
+            else:
+                # 結果節點內嵌 JSON 字串：優先以 bytes 直接切出，省去建立整棵 XML 樹
+                raw_text = _extract_result_bytes(response.content, result_tag)
+                if raw_text is not None:
+                    raw_text = raw_text.strip()
+                else:
+                    # 回應結構不如預期時，退回解析外層的 SOAP XML 再取出結果節點
+                    root = etree.fromstring(response.content, _XML_PARSER)
+                    result_node = self._extract_soap_body_content_xml_element(root, result_tag)
+                    raw_text = result_node.text.strip() if result_node is not None and result_node.text else ""
+
+            if not raw_text:
+                logger.warning(f"⚠️ 警告：{label} API 回應為空或不包含可解析的 JSON 字串。")
                 return None
 
-            # 確保內容是有效的 JSON 格式，可能會有 SOAP XML 的標籤混入
-            # 使用正則表達式找到第一個 '[' 到最後一個 ']' 之間的內容作為 JSON
-            match = re.search(r'(\[.+\])', json_str, re.DOTALL)
-            if match:
-                clean_json_str = match.group(1)
-            else:
-                logger.error(f"❌ 高運量線 API 回應內容不是有效的 JSON 格式，且無法提取: {json_str[:200]}...")
+            # 取以第一個 '[' 開頭、最後一個 ']' 結尾的內容，並忽略中間的所有字符（包括換行）
+            json_str = _slice_json_array(raw_text)
+            if json_str is None:
+                logger.error(f"❌ {label} API 回應中未找到有效的 JSON 陣列。原始回應前 200 字元: {_preview(raw_text, 200)}...")
                 return None
 
-            items = json.loads(clean_json_str)
+            try:
+                items = _json_lib.loads(json_str)
+            except json.JSONDecodeError:
+                # 陣列之後若還夾帶含 ']' 的內容，rfind 會切過頭；改從第一個 '[' 起只解析一個完整的 JSON 值
+                items = _decode_leading_json_array(json_str)
             if isinstance(items, list):
-                logger.info(f"✅ 成功解析了 {len(items)} 筆高運量線車廂擁擠度資料。")
+                logger.debug("✅ 成功解析了 %d 筆%s。", len(items), label)
                 return items
-            else:
-                logger.warning(f"⚠️ 警告：高運量線 API 解析成功，但不是預期的 JSON 陣列。類型: {type(items)}")
-                return None
+            logger.warning(f"⚠️ 警告：{label} API 解析成功，但不是預期的 JSON 陣列。類型: {type(items)}")
+        except etree.XMLSyntaxError as e:
+            logger.error(f"❌ 解析{label} API 的 SOAP XML 回應時發生錯誤: {e}", exc_info=True)
         except json.JSONDecodeError as e:
-            logger.error(f"❌ 解析高運量線 API 的 JSON 回應時發生錯誤: {e}. 原始字串可能為: {json_str[:500]}...", exc_info=True)
+            logger.error(f"❌ 解析{label} API 的 JSON 回應時發生錯誤: {e}. 原始字串可能為: {_preview(raw_text, 500)}...", exc_info=True)
         except Exception as e:
-            logger.error(f"❌ 處理高運量線 API 回應時發生未知錯誤: {e}", exc_info=True)
-        
+            logger.error(f"❌ 處理{label} API 回應時發生未知錯誤: {e}", exc_info=True)
+
         return None
 
-    def get_wenhu_car_weight_info(self) -> list[dict] | None:
+    def _call_dataset(self, endpoint_key: str, method: str, label: str) -> list[dict] | None:
         """
-        獲取文湖線車廂擁擠度資料。API 名稱: getCarWeightBRInfo
-        此 API 的回應是 SOAP XML，其結果節點內嵌**一個 JSON 陣列字串**。
+        呼叫結果節點內嵌 diffgr:diffgram XML 字串的端點 (遺失物、車站列表)，並解析為資料列表。
+        回應以串流方式邊下載邊解析，不另外保留完整的回應內容。
+        :param endpoint_key: API 端點在 self.api_endpoints 中的鍵。
+        :param method: SOAP 方法名稱；結果節點為 '<method>Result'。
+        :param label: 日誌中顯示的資料名稱。
+        :return: 轉換後的資料列表或 None。
         """
-        if not self.username or not self.password:
-            logger.error("❌ 錯誤：缺少台北捷運 API 的帳號或密碼，無法獲取文湖線車廂擁擠度資料。")
-            return None
-
-        body = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="{self.namespaces['xsi']}" xmlns:xsd="{self.namespaces['xsd']}" xmlns:soap="{self.namespaces['soap']}">
-  <soap:Body>
-    <getCarWeightBRInfo xmlns="{self.namespaces['tempuri']}">
-      <userName>{self.username}</userName>
-      <passWord>{self.password}</passWord>
-    </getCarWeightBRInfo>
-  </soap:Body>
-</soap:Envelope>"""
-
-        response = self._send_soap_request("WenhuCarWeight", f'"{self.namespaces["tempuri"]}getCarWeightBRInfo"', body)
+        body = self._prebuilt_bodies[method]
+        response = self._send_soap_request(endpoint_key, f'"{self.namespaces["tempuri"]}{method}"', body, stream=True,
+                                           read_timeout=_DATASET_READ_TIMEOUT)
         if response is None:
             return None
 
         try:
-            root = ET.fromstring(response.content) # 首先解析外層的 SOAP XML
-            # 找到包含 JSON 字串的結果節點
-            result_node = self._extract_soap_body_content_xml_element(root, 'getCarWeightBRInfoResult')
-            
-            if result_node is not None and result_node.text: # 確保節點存在且有文本內容
-                json_string_from_xml = result_node.text.strip()
-                
-                if not json_string_from_xml:
-                    logger.warning("⚠️ 警告：文湖線 API 回應的 XML 節點中未找到 JSON 字串。")
-                    return None
-
-                # 提取 JSON 字串（可能被額外的引號包圍，或者有其他雜亂字符）
-                # 這裡需要更強健的正則表達式來提取 JSON 陣列
-                match = re.search(r'(\[.+\])', json_string_from_xml, re.DOTALL)
-                if match:
-                    clean_json_str = match.group(1)
-                else:
-                    logger.error(f"❌ 文湖線 API 回應的 XML 節點內容不是有效的 JSON 格式，且無法提取: {json_string_from_xml[:200]}...")
-                    return None
-
-                items = json.loads(clean_json_str) # 將這個內嵌的 JSON 字串解析
-                if isinstance(items, list):
-                    logger.info(f"✅ 成功解析了 {len(items)} 筆文湖線車廂擁擠度資料。")
+            response.raw.decode_content = True # 讓 urllib3 自動處理 gzip 等傳輸壓縮
+            result_text = None
+            context = etree.iterparse(response.raw, events=('end',), tag=f"{{{self.namespaces['tempuri']}}}{method}Result",
+                                      resolve_entities=False, no_network=True)
+            for _, result_element in context:
+                result_text = result_element.text
+                break
+            if result_text:
+                items = self._parse_dataset_xml_string(result_text)
+                if items is not None:
+                    logger.debug("✅ 成功獲取並解析了 %d 筆%s。", len(items), label)
                     return items
-                else:
-                    logger.warning(f"⚠️ 警告：文湖線 API 解析成功，但不是預期的 JSON 陣列。類型: {type(items)}")
-                    return None
-            else:
-                logger.warning("⚠️ 警告：文湖線 API 回應格式不符合預期，未能找到或解析內嵌 JSON (result_node 或其text為空)。")
-        except ET.ParseError as e:
-            logger.error(f"❌ 解析文湖線 API 的 SOAP XML 回應時發生錯誤: {e}", exc_info=True)
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ 解析文湖線 API 內嵌的 JSON 回應時發生錯誤: {e}. 原始字串可能為: {json_string_from_xml[:500]}...", exc_info=True)
+            logger.warning(f"⚠️ 警告：{label} API 回應格式不符合預期或無資料。")
+        except etree.XMLSyntaxError as e:
+            logger.error(f"❌ 解析{label} API 的 SOAP XML 回應時發生錯誤: {e}", exc_info=True)
         except Exception as e:
-            logger.error(f"❌ 處理文湖線 API 回應時發生未知錯誤: {e}", exc_info=True)
-        
+            logger.error(f"❌ 處理{label} API 回應時發生未知錯誤: {e}", exc_info=True)
+        finally:
+            response.close()
+
         return None
 
+    # --- API 功能實現 ---
+
+    # 各端點依資料更新頻率設定快取存活時間：即時資料數秒、清單類資料數分鐘以上
+    @ttl_cache(ttl=10, maxsize=1, method=True)
+    def get_high_capacity_car_weight_info(self) -> list[dict] | None:
+        """
+        獲取高運量線車廂擁擠度資料。API 名稱: getCarWeightByInfoEx
+        此 API 的實際回應是**直接的 JSON 字串**，而非 SOAP XML。
+        """
+        return self._call_json_array("HighCapacityCarWeight", "getCarWeightByInfoEx", "高運量線車廂擁擠度資料")
+
+    @ttl_cache(ttl=10, maxsize=1, method=True)
+    def get_wenhu_car_weight_info(self) -> list[dict] | None:
+        """
+        獲取文湖線車廂擁擠度資料。API 名稱: getCarWeightBRInfo
+        此 API 的回應是 SOAP XML，其結果節點內嵌**一個 JSON 陣列字串**。
+        """
+        return self._call_json_array("WenhuCarWeight", "getCarWeightBRInfo", "文湖線車廂擁擠度資料", result_tag='getCarWeightBRInfoResult')
+
+    @ttl_cache(ttl=300, maxsize=1, method=True)
     def get_all_lost_items_soap(self) -> list[dict] | None:
         """
         呼叫 getLoseThingForWeb_ALL API，獲取所有遺失物資料。
         回應結果是一個 XML 元素，其文本內容包含 diffgr:diffgram 結構的 XML 字串。
         """
-        if not self.username or not self.password:
+        if not self._has_credentials:
             logger.error("❌ 錯誤：缺少台北捷運 API 的帳號或密碼，無法獲取遺失物資料。")
             return None
+        # 遺失物全集回應可達數 MB，串流解析可大幅降低記憶體用量
+        return self._call_dataset("LoseThing", "getLoseThingForWeb_ALL", "遺失物資料")
 
-        body = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="{self.namespaces['xsi']}" xmlns:xsd="{self.namespaces['xsd']}" xmlns:soap="{self.namespaces['soap']}">
-  <soap:Body>
-    <getLoseThingForWeb_ALL xmlns="{self.namespaces['tempuri']}">
-      <userName>{self.username}</userName>
-      <passWord>{self.password}</passWord>
-    </getLoseThingForWeb_ALL>
-  </soap:Body>
-</soap:Envelope>"""
-
-        response = self._send_soap_request("LoseThing", f'"{self.namespaces["tempuri"]}getLoseThingForWeb_ALL"', body)
-        if response is None:
-            return None
-        
-        try:
-            root = ET.fromstring(response.content)
-            result_element = self._extract_soap_body_content_xml_element(root, 'getLoseThingForWeb_ALLResult')
-            if result_element and result_element.text:
-                items = self._parse_dataset_xml_string(result_element.text)
-                if items is not None:
-                    logger.info(f"✅ 成功獲取並解析了 {len(items)} 筆遺失物資料。")
-                    return items
-            logger.warning("⚠️ 警告：遺失物 API 回應格式不符合預期或無資料。")
-        except ET.ParseError as e:
-            logger.error(f"❌ 解析遺失物 API 的 SOAP XML 回應時發生錯誤: {e}", exc_info=True)
-        except Exception as e:
-            logger.error(f"❌ 處理遺失物 API 回應時發生未知錯誤: {e}", exc_info=True)
-        
-        return None
-
+    @ttl_cache(ttl=300, maxsize=256, method=True)
     def get_recommand_route_soap(self, entry_sid: str, exit_sid: str) -> dict | None:
         """
         呼叫 GetRecommandRoute API，獲取推薦的搭乘路線。
         :param entry_sid: 起始車站的 SID。
         :param exit_sid: 終點車站的 SID。
         """
-        if not all([self.username, self.password, entry_sid, exit_sid]):
+        if not (self._has_credentials and entry_sid and exit_sid):
             logger.error("❌ 錯誤：缺少路線規劃所需的參數 (帳密或起終點 SID)。")
             return None
             
-        body = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="{self.namespaces['xsi']}" xmlns:xsd="{self.namespaces['xsd']}" xmlns:soap="{self.namespaces['soap']}">
-  <soap:Body>
-    <GetRecommandRoute xmlns="{self.namespaces['tempuri']}">
-      <entrySid>{entry_sid}</entrySid>
-      <exitSid>{exit_sid}</exitSid>
-      <username>{self.username}</username>
-      <password>{self.password}</password>
-    </GetRecommandRoute>
-  </soap:Body>
-</soap:Envelope>"""
+        params = b''.join((b'<entrySid>', _xml_escape(entry_sid), b'</entrySid><exitSid>', _xml_escape(exit_sid), b'</exitSid>',
+                           b'<username>', _xml_escape(self.username), b'</username><password>', _xml_escape(self.password), b'</password>'))
+        body = _soap_envelope(b'GetRecommandRoute', params)
 
         response = self._send_soap_request("RouteControl", f'"{self.namespaces["tempuri"]}GetRecommandRoute"', body)
         if response is None:
             return None
         
         try:
-            root = ET.fromstring(response.content)
+            root = etree.fromstring(response.content, _XML_PARSER)
             result_element = self._extract_soap_body_content_xml_element(root, 'GetRecommandRouteResult')
-            if result_element:
+            if result_element is not None:
                 route_info = self._xml_to_dict(result_element)
                 if route_info:
-                    logger.info("✅ 成功獲取並解析了推薦路線資料。")
+                    logger.debug("✅ 成功獲取並解析了推薦路線資料。")
                     return route_info
             logger.warning("⚠️ 警告：推薦路線 API 回應格式不符合預期或無資料。")
-        except ET.ParseError as e:
+        except etree.XMLSyntaxError as e:
             logger.error(f"❌ 解析推薦路線 API 的 SOAP XML 回應時發生錯誤: {e}", exc_info=True)
         except Exception as e:
             logger.error(f"❌ 處理推薦路線 API 回應時發生未知錯誤: {e}", exc_info=True)
         
         return None
 
+    # 車站列表幾乎不變，同步寫入磁碟快取，程式重啟後一天內不必再呼叫 API
+    @ttl_cache(ttl=86400, maxsize=1, cache_dir=config.SOAP_CACHE_DIR, method=True)
     def get_station_list_soap(self) -> list[dict] | None:
         """
         呼叫 GetStationList API，獲取所有車站列表。
         回應結果是一個 XML 元素，其文本內容包含 diffgr:diffgram 結構的 XML 字串。
         """
-        body = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap:Envelope xmlns:xsi="{self.namespaces['xsi']}" xmlns:xsd="{self.namespaces['xsd']}" xmlns:soap="{self.namespaces['soap']}">
-  <soap:Body>
-    <GetStationList xmlns="{self.namespaces['tempuri']}" />
-  </soap:Body>
-</soap:Envelope>"""
-
-        response = self._send_soap_request("RouteControl", f'"{self.namespaces["tempuri"]}GetStationList"', body)
-        if response is None:
-            return None
-        
-        try:
-            root = ET.fromstring(response.content)
-            result_element = self._extract_soap_body_content_xml_element(root, 'GetStationListResult')
-            if result_element and result_element.text:
-                stations = self._parse_dataset_xml_string(result_element.text)
-                if stations is not None:
-                    logger.info(f"✅ 成功獲取並解析了 {len(stations)} 筆車站列表資料。")
-                    return stations
-            logger.warning("⚠️ 警告：車站列表 API 回應格式不符合預期或無資料。")
-        except ET.ParseError as e:
-            logger.error(f"❌ 解析車站列表 API 的 SOAP XML 回應時發生錯誤: {e}", exc_info=True)
-        except Exception as e:
-            logger.error(f"❌ 處理車站列表 API 回應時發生未知錯誤: {e}", exc_info=True)
-        
-        return None
+        return self._call_dataset("RouteControl", "GetStationList", "車站列表資料")
 
+    @ttl_cache(ttl=10, maxsize=1, method=True)
     def get_realtime_track_info(self) -> list[dict] | None:
-            """
-            呼叫 getTrackInfo API，獲取即將在幾分鐘後抵達的列車預測資訊。
-            此 API 的回應格式特殊且不穩定，需要更強健的解析方式。
-            """
-            if not self.username or not self.password:
-                logger.error("❌ 錯誤：缺少台北捷運 API 的帳號或密碼，無法獲取即時列車資訊。")
-                return None
-
-            body = f"""<?xml version="1.0" encoding="utf-8"?>
-    <soap:Envelope xmlns:xsi="{self.namespaces['xsi']}" xmlns:xsd="{self.namespaces['xsd']}" xmlns:soap="{self.namespaces['soap']}">
-        <soap:Body>
-            <getTrackInfo xmlns="{self.namespaces['tempuri']}">
-                <userName>{self.username}</userName>
-                <passWord>{self.password}</passWord>
-            </getTrackInfo>
-        </soap:Body>
-    </soap:Envelope>"""
-
-            response = self._send_soap_request("TrainInfo", f'"{self.namespaces["tempuri"]}getTrackInfo"', body)
-            if response is None:
-                return None
-
-            try:
-                response_text = response.text.strip()
-                
-                if not response_text:
-                    logger.warning("⚠️ 警告：getTrackInfo API 回應為空。")
-                    return None
-                
-                # --- 【核心修正】這裡使用正則表達式尋找並提取 JSON 陣列 ---
-                # 這個模式會尋找以 '[' 開頭，以 ']' 結尾的內容，並忽略中間的所有字符（包括換行）
-                match = re.search(r'(\[.+\])', response_text, re.DOTALL)
-                
-                if not match:
-                    logger.error(f"❌ getTrackInfo API 回應中未找到有效的 JSON 陣列。原始回應前 200 字元: {response_text[:200]}...")
-                    return None
-                
-                json_str = match.group(1)
-
-                items = json.loads(json_str)
-                
-                if isinstance(items, list):
-                    clean_data = []
-                    for item in items:
-                        if not isinstance(item, dict):
-                            continue
-                        
-                        # 處理 Countdown
-                        countdown = item.get('CountDown', '未知')
-                        if '進站' in countdown:
-                            countdown = '列車進站'
-                        else:
-                            try:
-                                # 確保 countdown 是 "分鐘:秒" 格式
-                                m, s = map(int, countdown.split(':'))
-                                countdown = f"{m} 分鐘 {s} 秒"
-                            except (ValueError, IndexError):
-                                countdown = '未知'
-
-                        clean_data.append({
-                            'StationName': item.get('StationName'),
-                            'DestinationName': item.get('DestinationName'),
-                            'CountDown': countdown,
-                            'NowDateTime': item.get('NowDateTime'),
-                            'LineID': item.get('LineID'),
-                            'StationID': item.get('StationID')
-                        })
-                    
-                    logger.info(f"✅ 成功解析了 {len(clean_data)} 筆即時列車預測資訊。")
-                    return clean_data
-                else:
-                    logger.warning(f"⚠️ 警告：getTrackInfo API 解析成功，但不是預期的 JSON 陣列。類型: {type(items)}")
-                    return None
-            except json.JSONDecodeError as e:
-                logger.error(f"❌ 解析 getTrackInfo API 提取的 JSON 回應時發生錯誤: {e}. 原始字串可能為: {json_str[:500]}...", exc_info=True)
-            except Exception as e:
-                logger.error(f"❌ 處理 getTrackInfo API 回應時發生未知錯誤: {e}", exc_info=True)
-            
+        """
+        呼叫 getTrackInfo API，獲取即將在幾分鐘後抵達的列車預測資訊。
+        此 API 的回應格式特殊且不穩定，回應本身即為 JSON 陣列但可能混有其他字元。
+        """
+        items = self._call_json_array("TrainInfo", "getTrackInfo", "即時列車預測資訊")
+        if items is None:
             return None
 
-# 建立 MetroSoapService 的一個實例 (instance)，並命名為 metro_soap_api
-metro_soap_api = MetroSoapService(
-    username=config.METRO_API_USERNAME,
-    password=config.METRO_API_PASSWORD
-)
\ No newline at end of file
+        clean_data = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+
+            # 處理 Countdown
+            countdown = item.get('CountDown', '未知')
+            if '進站' in countdown:
+                countdown = '列車進站'
+            else:
+                try:
+                    # 確保 countdown 是 "分鐘:秒" 格式
+                    m, s = map(int, countdown.split(':'))
+                    countdown = f"{m} 分鐘 {s} 秒"
+                except (ValueError, IndexError):
+                    countdown = '未知'
+
+            clean_data.append({
+                'StationName': item.get('StationName'),
+                'DestinationName': item.get('DestinationName'),
+                'CountDown': countdown,
+                'NowDateTime': item.get('NowDateTime'),
+                'LineID': item.get('LineID'),
+                'StationID': item.get('StationID')
+            })
+        return clean_data
+
+@functools.cache
+def get_metro_soap_api() -> MetroSoapService:
+    """取得全域共用的 MetroSoapService；第一次呼叫時才建立 (連線池、執行緒池與預先組好的請求主體)。"""
+    return MetroSoapService(
+        username=config.METRO_API_USERNAME,
+        password=config.METRO_API_PASSWORD
+    )
+
+def close_metro_soap_api() -> None:
+    """
+    關閉全域共用的 MetroSoapService 並清除單例快取，供程式結束時呼叫；
+    之後再呼叫 get_metro_soap_api() 會建立新的實例，不會拿到已關閉的執行緒池。
+    """
+    if get_metro_soap_api.cache_info().currsize:
+        instance = get_metro_soap_api()
+        get_metro_soap_api.cache_clear()
+        instance.close()
+
+def __getattr__(name: str):
+    # 相容既有的 `from services.metro_soap_service import metro_soap_api`：匯入本模組本身不會建立實例
+    if name == 'metro_soap_api':
+        return get_metro_soap_api()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -21,8 +21,9 @@ if PROJECT_ROOT not in sys.path:
     sys.path.append(PROJECT_ROOT)
 
 from services.station_service import StationManager
-from services.metro_soap_service import metro_soap_api
+from services.metro_soap_service import get_metro_soap_api
 import config
+from utils.transfer_stations import load_transfer_stations
 
 # --- 配置日誌 ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -33,9 +34,9 @@ class CongestionPredictor:
         logger.info("--- [Predictor] 正在初始化人流預測服務... ---")
         self.station_manager = station_manager_instance
         self.models: Dict[str, xgb.XGBClassifier] = {}
-        self.encoders: Dict[str, any] = {}
-        self.scalers: Dict[str, any] = {}
+        self.categories: Dict[str, Dict[str, pd.Index]] = {}
         self.feature_columns: Dict[str, list] = {}
+        self.transfer_stations = self._load_transfer_stations()
         self.is_ready = self._load_all_models()
 
         if self.is_ready:
@@ -43,15 +44,18 @@ class CongestionPredictor:
         else:
             logger.error("--- ❌ 預測服務初始化失敗，部分模型或檔案缺失。 ---")
 
+    def _load_transfer_stations(self) -> frozenset:
+        """初始化時載入一次轉乘站 ID 集合 (與訓練端使用同一份預先建好的資料)。"""
+        return load_transfer_stations()
+
     def _load_all_models(self) -> bool:
         all_loaded = True
         for line_type in ['high_capacity', 'wenhu']:
-            model_path = os.path.join(MODEL_DIR, f'{line_type}_congestion_model.json')
-            encoder_path = os.path.join(MODEL_DIR, f'{line_type}_encoder.joblib')
-            scaler_path = os.path.join(MODEL_DIR, f'{line_type}_scaler.joblib')
-            features_path = os.path.join(MODEL_DIR, f'{line_type}_feature_columns.csv')
+            model_path = os.path.join(MODEL_DIR, f'{line_type}_congestion_model.ubj')
+            categories_path = os.path.join(MODEL_DIR, f'{line_type}_categories.joblib')
+            features_path = os.path.join(MODEL_DIR, f'{line_type}_feature_columns.json')
             
-            if not all(os.path.exists(p) for p in [model_path, encoder_path, scaler_path, features_path]):
+            if not all(os.path.exists(p) for p in [model_path, categories_path, features_path]):
                 logger.warning(f"--- ⚠️ 在路徑 '{MODEL_DIR}' 中找不到 {line_type} 的模型檔案，請先運行 model_trainer.py。 ---")
                 all_loaded = False
                 continue
@@ -59,9 +63,9 @@ class CongestionPredictor:
             try:
                 self.models[line_type] = xgb.XGBClassifier()
                 self.models[line_type].load_model(model_path)
-                self.encoders[line_type] = joblib.load(encoder_path)
-                self.scalers[line_type] = joblib.load(scaler_path)
-                self.feature_columns[line_type] = pd.read_csv(features_path)['feature'].tolist()
+                self.categories[line_type] = joblib.load(categories_path)
+                with open(features_path, 'r', encoding='utf-8') as f:
+                    self.feature_columns[line_type] = json.load(f)
                 logger.info(f"--- ✅ 已成功從 '{MODEL_DIR}' 載入 {line_type} 模型。 ---")
             except Exception as e:
                 logger.error(f"載入 {line_type} 模型時發生錯誤: {e}", exc_info=True)
@@ -82,10 +86,6 @@ class CongestionPredictor:
         """
         根據指定的日期時間，創建模型所需的特徵。
         """
-        with open(os.path.join(DATA_DIR, 'mrt_station_info.json'), 'r', encoding='utf-8') as f:
-            station_info = json.load(f)
-        transfer_stations = {sid for info in station_info.values() if isinstance(info, dict) for sid in info.get('station_ids', []) if info.get('is_transfer')}
-        
         # --- 【關鍵修正】根據時間段模擬更合理的滯後擁擠度值 ---
         # 這裡根據時間段和是否為尖峰時段，給出一個更合理的預設值
         lag_5min_congestion = 0.0
@@ -116,30 +116,20 @@ class CongestionPredictor:
                 'day_of_week': target_datetime.weekday(),
                 'is_weekend': int(target_datetime.weekday() >= 5),
                 'is_peak_hour': int(target_datetime.hour in [7, 8, 17, 18, 19]),
-                'is_transfer_station': int(station_id in transfer_stations),
+                'is_transfer_station': int(station_id in self.transfer_stations),
                 'car_number': car_num,
                 'lag_5min_congestion': lag_5min_congestion,
                 'lag_1hr_congestion': lag_1hr_congestion
             })
         
-        df_raw = pd.DataFrame(records)
-        
-        encoder = self.encoders[line_type]
-        categorical_features = ['station_id', 'line_direction_cid']
-        encoded_data = encoder.transform(df_raw[categorical_features])
-        encoded_df = pd.DataFrame(encoded_data, columns=encoder.get_feature_names_out(categorical_features))
-        
-        numeric_features = [
-            'hour', 'minute', 'day_of_week', 'is_weekend', 'is_peak_hour', 'is_transfer_station',
-            'car_number', 'lag_5min_congestion', 'lag_1hr_congestion'
-        ]
-        
-        final_df = pd.concat([df_raw[numeric_features].reset_index(drop=True), encoded_df.reset_index(drop=True)], axis=1)
+        final_df = pd.DataFrame(records)
         
-        scaler = self.scalers[line_type]
-        final_df[numeric_features] = scaler.transform(final_df[numeric_features])
+        # 類別特徵需使用訓練時的類別清單建立 Categorical，未見過的值會成為缺失值交由模型處理
+        for col, categories in self.categories[line_type].items():
+            values = final_df[col].where(final_df[col].isin(categories))
+            final_df[col] = pd.Categorical(values, categories=categories)
         
-        final_df = final_df.reindex(columns=self.feature_columns[line_type], fill_value=0)
+        final_df = final_df[self.feature_columns[line_type]]
         
         return final_df
 
@@ -203,7 +193,7 @@ class CongestionPredictor:
 
         logger.info(f"--- 🚀 正在從 Metro API 獲取即時列車資訊以查找車站 '{station_name}' 往 '{direction}' 方向 ---")
         try:
-            all_train_info = metro_soap_api.get_realtime_track_info()
+            all_train_info = get_metro_soap_api().get_realtime_track_info()
         except Exception as e:
             logger.error(f"獲取即時列車資訊時發生錯誤: {e}", exc_info=True)
             return {"error": "無法從 Metro API 獲取即時列車資訊，請檢查服務連線。"}
@@ -24,8 +24,10 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 class StationManager:
-    def __init__(self, station_data_path: str):
+    def __init__(self, station_data_path: str, sid_map_path: str = config.STATIONS_SID_MAP_PATH):
         self.station_data_path = station_data_path
+        # 車站 ID -> SOAP SID 對照表，啟動時載入一次，之後皆為 O(1) 查表
+        self.sid_map: Dict[str, str] = self._load_sid_map(sid_map_path)
         
         # 【新增】站名別名映射：鍵是使用者可能輸入的別名 (已標準化)，值是官方全名 (未標準化)
         # 這裡的鍵必須是經過 _normalize_name_for_map 處理後的，以確保查找時的一致性
@@ -157,6 +159,14 @@ class StationManager:
         self._add_aliases_to_station_map()
 
 
+    def _load_sid_map(self, sid_map_path: str) -> Dict[str, str]:
+        try:
+            with open(sid_map_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"--- ⚠️ 無法載入車站 SID 對照表 {os.path.basename(sid_map_path)}: {e} ---")
+            return {}
+
     def _load_or_create_station_data(self) -> dict:
         """
         嘗試從本地檔案載入站點資料。如果檔案不存在、損壞或為空，
@@ -332,6 +342,18 @@ class StationManager:
             logger.warning(f"--- ❌ 無法處理或解析站點名稱: '{station_name}' ---")
             return None
 
+    def get_sid(self, station_name: str, line_prefix: Optional[str] = None) -> Optional[str]:
+        """
+        根據站名回傳北捷 SOAP API 使用的 SID。
+        轉乘站會有多個 ID，可用 line_prefix (如 'BR') 指定路線，否則取第一個有 SID 的 ID。
+        """
+        station_ids = self.get_station_ids(station_name)
+        if not station_ids:
+            return None
+        if line_prefix:
+            station_ids = [sid for sid in station_ids if sid.startswith(line_prefix)] or station_ids
+        return next((self.sid_map[sid] for sid in station_ids if sid in self.sid_map), None)
+
     # 【新增】resolve_direction 方法
     def resolve_direction(self, station_name: str, direction_query: str) -> List[str]:
         """
@@ -1,7 +1,10 @@
 # services/tdx_service.py
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import config
+from utils.cache import ttl_cache, cache_identity
 import time
 import json 
 import logging
@@ -12,9 +15,17 @@ class TDXApi:
     def __init__(self, client_id: str, client_secret: str):
         self.client_id = client_id
         self.client_secret = client_secret
+        # 票價與路網快取以此區分不同的 TDX 用戶端
+        self._cache_identity = cache_identity(client_id, client_secret)
         self.base_url = "https://tdx.transportdata.tw/api/basic"
         self.auth_url = "https://tdx.transportdata.tw/auth/realms/TDXConnect/protocol/openid-connect/token"
         self.access_token = None
+        # 共用同一個 Session，重複利用 keep-alive 連線，省去每次請求的 TCP/TLS 握手
+        self.session = requests.Session()
+        # 429 不在此重試：_get_api_data 已有以倍增等待處理 429 的重試迴圈，兩層疊加會浪費配額
+        retry_policy = Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504], raise_on_status=False)
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry_policy))
+        self.session.headers.update({'accept': 'application/json'})
         self._get_access_token()
 
     def _get_access_token(self):
@@ -22,13 +33,15 @@ class TDXApi:
         headers = {'content-type': 'application/x-www-form-urlencoded'}
         data = {'grant_type': 'client_credentials', 'client_id': self.client_id, 'client_secret': self.client_secret}
         try:
-            response = requests.post(self.auth_url, headers=headers, data=data, timeout=20)
+            response = self.session.post(self.auth_url, headers=headers, data=data, timeout=(3, 10))
             response.raise_for_status()
             logger.info("--- ✅ 成功獲取 TDX Access Token！ ---")
             self.access_token = response.json().get('access_token')
+            self.session.headers['authorization'] = f'Bearer {self.access_token}'
         except requests.RequestException as e:
             logger.error(f"--- ❌ 獲取 Access Token 失敗: {e} ---", exc_info=True)
             self.access_token = None
+            self.session.headers.pop('authorization', None)
             
     def _get_api_data(self, url: str, retry: int = 5, delay: int = 10):
         """【強化版】API 資料獲取函式"""
@@ -36,16 +49,14 @@ class TDXApi:
             logger.error("--- ❌ 無法獲取 Access Token，無法進行 API 請求。 ---")
             return None
         
-        headers = {'authorization': f'Bearer {self.access_token}', 'accept': 'application/json'}
         for attempt in range(retry):
             try:
-                response = requests.get(url, headers=headers, timeout=30)
+                response = self.session.get(url, timeout=(3, 10))
                 
                 if response.status_code == 401:
                     logger.warning("--- ⚠️ Access Token 已過期或無效，正在重新獲取... ---")
                     self._get_access_token()
                     if not self.access_token: return None
-                    headers['authorization'] = f'Bearer {self.access_token}'
                     continue
 
                 response.raise_for_status()
@@ -81,7 +92,10 @@ class TDXApi:
             page_data = self._get_api_data(paginated_url)
             
             if page_data is None:
-                break
+                # 中途任何一頁失敗都視為整體失敗，不回傳 (也不讓快取保存) 截斷的部分資料
+                if all_data:
+                    logger.error(f"--- ❌ 分頁資料在第 {skip // page_size + 1} 頁取得失敗，捨棄已取得的 {len(all_data)} 筆部分資料: {base_url} ---")
+                return None
             
             if not page_data:
                 break
@@ -101,6 +115,8 @@ class TDXApi:
         url = f"{self.base_url}/v2/Rail/Metro/StationOfRoute/TRTC?$format=JSON"
         return self._get_all_data_paginated(url)
 
+    # 票價約一年才調整一次、路網更少變動，快取於記憶體與磁碟以節省 TDX 配額
+    @ttl_cache(ttl=86400, maxsize=4, cache_dir=config.API_CACHE_DIR, method=True)
     def get_all_fares(self):
         url = f"{self.base_url}/v2/Rail/Metro/ODFare/TRTC?$format=JSON"
         return self._get_all_data_paginated(url, page_size=1000)
@@ -117,6 +133,7 @@ class TDXApi:
         url = f"{self.base_url}/v2/Rail/Metro/StationExit/{rail_system}?$format=JSON"
         return self._get_all_data_paginated(url)
     
+    @ttl_cache(ttl=7 * 86400, maxsize=4, cache_dir=config.API_CACHE_DIR, method=True)
     def get_mrt_network(self):
         url = f"{self.base_url}/v2/Rail/Metro/Network/TRTC?$format=JSON"
         return self._get_all_data_paginated(url)
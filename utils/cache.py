@@ -0,0 +1,134 @@
+# utils/cache.py
+
+import os
+import copy
+import json
+import time
+import hashlib
+import logging
+import threading
+import functools
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+def cache_identity(*credentials: str) -> str:
+    """
+    由帳密產生簡短的雜湊值，供服務類別設為 `_cache_identity`；
+    不同帳號的實例各自使用獨立的快取鍵，磁碟快取中也不會出現明文帳密。
+    """
+    return hashlib.sha256('\0'.join(credentials).encode('utf-8')).hexdigest()[:16]
+
+def ttl_cache(ttl: float, maxsize: int = 128, cache_dir: str | None = None, method: bool = False):
+    """
+    具有存活時間 (TTL) 的記憶化裝飾器，可選擇同步寫入磁碟，讓程式重啟後不必重新呼叫外部 API。
+
+    Args:
+        ttl (float): 快取項目的存活秒數。
+        maxsize (int): 記憶體中最多保留的項目數，超過時淘汰最久未使用者。
+        cache_dir (str | None): 磁碟快取目錄；為 None 時只使用記憶體快取。
+        method (bool): 裝飾實例方法時設為 True；第一個參數 self 以其 `_cache_identity`
+            (未定義時為 id(self)) 納入快取鍵，不同帳密的實例不會共用快取。
+
+    Notes:
+        - 快取鍵為呼叫參數的 repr。
+        - 回傳 None 視為失敗，不會被快取。
+        - 存入與取出時皆會深複製，呼叫端就地修改回傳值不會影響快取。
+        - 寫入磁碟的值必須可被 JSON 序列化；每個快取鍵各自一個檔案，且在鎖外寫入。
+    """
+    def decorator(func):
+        entries: OrderedDict = OrderedDict()
+        lock = threading.Lock()
+        disk_dir = os.path.join(cache_dir, func.__qualname__) if cache_dir else None
+
+        def _disk_path(key: str) -> str:
+            return os.path.join(disk_dir, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json")
+
+        if disk_dir and os.path.isdir(disk_dir):
+            now = time.time()
+            loaded = []
+            for name in os.listdir(disk_dir):
+                if not name.endswith('.json'):
+                    continue
+                try:
+                    with open(os.path.join(disk_dir, name), 'r', encoding='utf-8') as f:
+                        record = json.load(f)
+                    if record['expires'] > now:
+                        loaded.append((record['expires'], record['key'], record['value']))
+                except (OSError, ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"--- ⚠️ 讀取磁碟快取 {name} 失敗，將忽略此筆: {e} ---")
+            # 依到期時間排序，超過 maxsize 時只保留最晚到期的幾筆
+            for expires, key, value in sorted(loaded)[-maxsize:]:
+                entries[key] = (expires, value)
+            if entries:
+                logger.info(f"--- ✅ 已從磁碟載入 {len(entries)} 筆 {func.__qualname__} 快取 ---")
+
+        def _persist(key: str, expires: float, value):
+            path = _disk_path(key)
+            os.makedirs(disk_dir, exist_ok=True)
+            # 暫存檔名加上執行緒 ID，避免同時寫入同一鍵時互相覆蓋暫存檔
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'expires': expires, 'value': value}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+
+        def _discard(key: str):
+            try:
+                os.remove(_disk_path(key))
+            except FileNotFoundError:
+                pass
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if method:
+                instance = args[0]
+                key_args = (getattr(instance, '_cache_identity', id(instance)),) + args[1:]
+            else:
+                key_args = args
+            key = repr((key_args, sorted(kwargs.items())))
+            now = time.time()
+            with lock:
+                hit = entries.get(key)
+                if hit and hit[0] > now:
+                    entries.move_to_end(key)
+                    cached = hit[1]
+                else:
+                    cached = None
+            if cached is not None:
+                return copy.deepcopy(cached)
+
+            value = func(*args, **kwargs)
+            if value is None:
+                return value
+
+            expires = now + ttl
+            stored = copy.deepcopy(value)
+            evicted = []
+            with lock:
+                entries[key] = (expires, stored)
+                entries.move_to_end(key)
+                while len(entries) > maxsize:
+                    evicted.append(entries.popitem(last=False)[0])
+            # 磁碟 I/O 在鎖外進行，寫入大型資料時不會阻塞其他執行緒的快取命中
+            if disk_dir:
+                try:
+                    _persist(key, expires, stored)
+                    for old_key in evicted:
+                        _discard(old_key)
+                except (OSError, TypeError, ValueError) as e:
+                    logger.warning(f"--- ⚠️ 寫入磁碟快取 {disk_dir} 失敗: {e} ---")
+            return value
+
+        def cache_clear():
+            with lock:
+                entries.clear()
+            if disk_dir and os.path.isdir(disk_dir):
+                for name in os.listdir(disk_dir):
+                    try:
+                        os.remove(os.path.join(disk_dir, name))
+                    except OSError:
+                        pass
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
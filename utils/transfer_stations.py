@@ -0,0 +1,49 @@
+# utils/transfer_stations.py
+
+import os
+import re
+import json
+import pickle
+import logging
+
+import config
+
+logger = logging.getLogger(__name__)
+
+_LINE_PREFIX_PATTERN = re.compile(r'^[A-Z]+')
+
+def compute_transfer_stations(station_map: dict) -> frozenset:
+    """
+    由站名 -> 車站 ID 列表的對照表推導轉乘站：同一站名對應到兩條以上路線 (ID 前綴不同) 者即為轉乘站。
+
+    Args:
+        station_map (dict): 例如 {"台北車站": ["BL12", "R10"], ...}。
+
+    Returns:
+        frozenset: 所有轉乘站的車站 ID。
+    """
+    transfer_ids = set()
+    for station_ids in station_map.values():
+        lines = {match.group() for sid in station_ids if (match := _LINE_PREFIX_PATTERN.match(sid))}
+        if len(lines) > 1:
+            transfer_ids.update(station_ids)
+    return frozenset(transfer_ids)
+
+def save_transfer_stations(station_map: dict, path: str = config.TRANSFER_STATIONS_PATH) -> frozenset:
+    """計算轉乘站集合並序列化為 pickle，供訓練與預測端直接載入。"""
+    transfer_stations = compute_transfer_stations(station_map)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(transfer_stations, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return transfer_stations
+
+def load_transfer_stations(path: str = config.TRANSFER_STATIONS_PATH) -> frozenset:
+    """
+    載入預先建好的轉乘站集合；尚未執行 build_database.py 產生 pickle 時，退回由站點資料庫 JSON 即時推導。
+    """
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    logger.warning(f"--- ⚠️ 找不到 {os.path.basename(path)}，改由 {os.path.basename(config.STATION_DATA_PATH)} 推導轉乘站。 ---")
+    with open(config.STATION_DATA_PATH, 'r', encoding='utf-8') as f:
+        return compute_transfer_stations(json.load(f))